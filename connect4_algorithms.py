@@ -6,15 +6,44 @@ This is a temporary script file.
 """
 import numpy as np  
 import math
-import copy
 import random
-
-import torch
+import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 import neural_net_trainer as neural_net
+import connect4_inference as inference
+import connect4_bitboard as bb
+import connect4_board as game_board
+import connect4_transposition as tt
+import connect4_book as opening
+import connect4_solver as solver
+import connect4_mcts as mcts
+import connect4_instrumentation as instrumentation
+
+ALGORITHMS = [     #Algorithms a computer player can use
+    'Random',
+    'Minimax',
+    'Minimax with A-B Pruning',
+    'Principal Variation Search',
+    'Artificial Neural Network',
+    'Solver',
+    'MCTS'
+]
+BOOK_ALGORITHMS = ['Minimax', 'Minimax with A-B Pruning', 'Principal Variation Search']   #Algorithms that use an opening book if given one
+ASPIRATION_WINDOW = 8   #Half-width of the root window Principal Variation Search puts around the last score
+SOLVER_TIME_MS = 3000   #Time the Solver tries to solve a move in when no time_limit_ms is given
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget for the move has run out.
+    """
     
 class Player:    
-    def __init__(self,value, opp_value,algorithm_value,depth,colour):
+    def __init__(self,value, opp_value,algorithm_value,depth,colour,table_size_mb=tt.DEFAULT_SIZE_MB,persist_table=False,
+                 time_limit_ms=None,workers=1,checkpoint=neural_net.DEFAULT_CHECKPOINT,move_ordering=True,book=None,endgame_table=None,
+                 playouts=mcts.DEFAULT_PLAYOUTS,mcts_prior=False,instrument=False,trace_path=None,pondering=False,
+                 forced_moves=True):
         self.player_number = value
         self.opponent_number = opp_value
         self.player_algorithm = algorithm_value
@@ -23,7 +52,53 @@ class Player:
         self.player_score = 0
         self.player_moves = 0
         self.depth = depth
-        self.cnn = neural_net.ConvNet()
+        self.checkpoint = checkpoint    #Model used by the Artificial Neural Network algorithm
+        self.persist_table = persist_table  #Keep the transposition table between games
+        self.time_limit_ms = time_limit_ms  #When set, Minimax deepens iteratively until the budget is spent
+        self.deadline = None
+        self.zero_horizon = depth==8    #Score the horizon as 0, as the original fixed depth 8 search does
+        self.workers = workers  #Processes the root columns are searched across
+        self.table_size_mb = table_size_mb
+        self.pool = None
+        self.nodes = 0
+        self.completed_depth = 0
+        self.last_score = None  #Score of the last move searched, from this player's point of view
+        self.move_ordering = move_ordering  #Order moves dynamically when alpha-beta pruning is used
+        self.forced_moves = forced_moves    #Play wins and blocks at once and skip losing moves when alpha-beta pruning is used
+        self.killers = [[None, None] for n in range(43)]    #Two moves that caused cut-offs, by number of discs
+        self.history = [[0]*(7*bb.COLUMN_BITS), [0]*(7*bb.COLUMN_BITS)]   #Cut-off counts of each player, by cell
+        if table_size_mb:
+            self.transposition_table = tt.TranspositionTable(table_size_mb)
+        else:
+            self.transposition_table = None
+        if isinstance(book,str):    #Opening book answering the first plies of the Minimax algorithms
+            book = opening.OpeningBook.load(book)
+        self.book = book
+        self.endgame_table = endgame_table  #Optional connect4_solver.EndgameTable (or its file) for the Solver
+        self.solver = None
+        self.solution = None    #Result ('win', 'loss' or 'draw') and moves to the end found by the Solver
+        self.fallbacks = 0  #Solver moves that could not be solved in time and were searched with alpha-beta
+        self.playouts = playouts    #Playouts per MCTS move when there is no time limit
+        self.mcts_prior = mcts_prior    #Guide MCTS with the CNN of self.checkpoint
+        self.mcts = None
+        self.instrument = instrument or trace_path is not None    #Record a SearchStats for every move
+        self.trace_path = trace_path    #JSON lines file the stats of every move are appended to
+        self.move_stats = None  #SearchStats of the last move
+        self.recording = None   #SearchStats of the move being chosen, while instrumented
+        self.game_stats = []    #SearchStats of every move of the current game
+        self.game_number = 0
+        self.cancelled = False  #Set by cancel to stop a search running in another thread
+        self.pondering = pondering  #Ponder the opponent's replies in a background thread after each move
+        self.ponder_thread = None
+        self.ponder_stop = False    #Set by __stop_pondering to end the ponder search, apart from cancelled
+        self.ponder_grid = None     #Grid the opponent is to move in while pondering
+        self.ponder_start = 0.0
+        self.predicted = None   #Reply the last search expected, pondered first
+        self.ponder_searches = {}   #Seconds of the completed ponder searches, by hash of the position searched
+        self.ponders = 0    #Moves that followed a ponder of the position before them
+        self.ponder_hits = 0    #Of those, moves where the opponent played the predicted reply
+        self.ponder_seconds = 0.0
+        self.saved_seconds = 0.0
     
     def get_player_score(self):
         """
@@ -58,6 +133,110 @@ class Player:
         """
         return self.player_number
     
+    def get_table_stats(self):
+        """
+        Gets the transposition table counters (hit rate, occupancy, etc.).
+
+        Returns
+        -------
+        dict or None
+            The table statistics, or None if the player has no transposition table.
+        """
+        if self.transposition_table is None:
+            return None
+        return self.transposition_table.get_stats()
+    
+    def get_book_stats(self):
+        """
+        Gets the opening book counters (size, lookups, hit rate).
+
+        Returns
+        -------
+        dict or None
+            The book statistics, or None if the player has no opening book.
+        """
+        if self.book is None:
+            return None
+        return self.book.get_stats()
+    
+    def get_ponder_stats(self):
+        """
+        Gets the pondering counters: how often the predicted reply was played and how
+        much waiting the completed ponder searches saved.
+
+        Returns
+        -------
+        dict or None
+            The pondering statistics, or None if the player does not ponder.
+        """
+        if not self.pondering:
+            return None
+        return {
+            'ponders': self.ponders,
+            'hits': self.ponder_hits,
+            'hit_rate': self.ponder_hits / self.ponders if self.ponders else 0.0,
+            'ponder_seconds': self.ponder_seconds,
+            'saved_seconds': self.saved_seconds,
+        }
+    
+    def new_game(self):
+        """
+        Prepares the player for a new game, clearing the transposition table
+        unless it is set to persist between games.
+
+        Returns
+        -------
+        None.
+        """
+        self.stop_pondering()
+        if self.transposition_table is not None and not self.persist_table:
+            self.transposition_table.clear()
+        if self.solver is not None and not self.persist_table:
+            self.solver.table.clear()
+        if self.mcts is not None:
+            self.mcts.reset()
+        if self.instrument:
+            self.game_stats = []
+            self.game_number += 1
+    
+    def close(self):
+        """
+        Shuts down the worker processes used by the parallel search, if any were started.
+
+        Returns
+        -------
+        None.
+        """
+        self.stop_pondering()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+    
+    def cancel(self):
+        """
+        Stops a Minimax or Solver search running in another thread, e.g. when the
+        GUI leaves the game. The search raises SearchTimeout at its next clock check
+        and the player stays cancelled until cancelled is set back to False.
+
+        Returns
+        -------
+        None.
+        """
+        self.cancelled = True
+        if self.solver is not None:
+            self.solver.deadline = 0
+    
+    def stop_pondering(self):
+        """
+        Stops the ponder thread, if one is running, e.g. when the game has ended.
+
+        Returns
+        -------
+        None.
+        """
+        if self.ponder_thread is not None:
+            self.__stop_pondering(None)
+    
     def get_player_algorithm(self):
         #########
         return self.player_algorithm
@@ -117,23 +296,180 @@ class Player:
         """
         Acquires the algorithm that the player is supposed to use.
         
+        Parameters
+        ----------
+        grid : list, numpy array or Board
+            Current state of the game. A Board is read as its grid, and searched from
+            its bitboards.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        pondered = None
+        if self.ponder_thread is not None:
+            pondered = self.__stop_pondering(grid)
+        start = time.perf_counter()
+        if self.instrument:
+            y,x = self.__instrumented_move(grid)
+        else:
+            y,x = self.__choose_move(grid)
+        if pondered is not None:
+            self.saved_seconds += max(0.0,pondered - (time.perf_counter() - start))
+        if self.pondering:
+            self.__start_pondering(grid,x)
+        return y,x
+    
+    def __start_pondering(self,grid,x):
+        """
+        Starts pondering the position after this player's move in a background
+        thread, the reply the search predicted first.
+
         Parameters
         ----------
         grid : list
-            Current state of the game.
+            State of the game before the move.
+        x : int
+            Column of the move.
 
         Returns
         -------
         None.
         """
+        if self.player_algorithm not in BOOK_ALGORITHMS or self.transposition_table is None:
+            return
+        board = self.__to_bitboard(grid)
+        if not board.can_play(x) or board.is_winning_move(x,self.player_number):
+            return
+        board.play(x,self.player_number)
+        if board.is_full():
+            return
+        self.predicted = self.transposition_table.get_move(board.hash ^ bb.SIDE_KEY)
+        self.ponder_grid = board.to_grid()
+        self.ponder_searches = {}
+        self.ponder_start = time.perf_counter()
+        self.ponder_thread = threading.Thread(target=self.ponder,args=(self.ponder_grid,self.predicted),daemon=True)
+        self.ponder_thread.start()
+    
+    def __stop_pondering(self,grid):
+        """
+        Stops the ponder thread and checks whether the opponent played the reply
+        that was predicted.
+
+        Parameters
+        ----------
+        grid : list or None
+            Current state of the game, or None if the game has ended.
+
+        Returns
+        -------
+        float or None
+            Seconds the completed ponder searches spent on the current position, or
+            None if it does not follow the position pondered.
+        """
+        self.ponder_stop = True
+        self.ponder_thread.join()
+        self.ponder_thread = None
+        self.ponder_stop = False
+        self.ponder_seconds += time.perf_counter() - self.ponder_start
+        if grid is None:
+            return None
+        changed = np.argwhere(np.asarray(grid)!=self.ponder_grid)
+        if len(changed)!=1:     #Not one reply on from the pondered position, e.g. a new game
+            return None
+        self.ponders += 1
+        if int(changed[0][1])==self.predicted:
+            self.ponder_hits += 1
+        return self.ponder_searches.get(self.__to_bitboard(grid).hash,0.0)
+    
+    def __instrumented_move(self,grid):
+        """
+        Chooses a move while recording its SearchStats in move_stats and game_stats,
+        and in the trace log if there is one.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        stats = instrumentation.SearchStats(self.player_algorithm,self.depth,int(np.count_nonzero(grid)))
+        self.move_stats = stats
+        table = self.transposition_table
+        if table is not None:
+            probes,hits = table.probes,table.hits
+        self.nodes = 0
+        self.completed_depth = 0
+        self.last_score = None
+        self.recording = stats
+        start = time.perf_counter()
+        try:
+            y,x = self.__choose_move(grid)
+        finally:
+            self.recording = None
+        stats.seconds = time.perf_counter() - start
+        stats.column = x
+        stats.score = self.last_score
+        stats.nodes = self.nodes
+        stats.completed_depth = self.completed_depth
+        if table is not None:
+            stats.tt_probes = table.probes - probes
+            stats.tt_hits = table.hits - hits
+        self.game_stats.append(stats)
+        if self.trace_path is not None:
+            record = stats.as_dict()
+            record['game'] = self.game_number
+            record['move'] = len(self.game_stats)
+            record['player'] = self.player_number
+            if isinstance(record['score'],float) and math.isinf(record['score']):
+                record['score'] = str(record['score'])  #JSON has no infinity
+            instrumentation.write_trace(self.trace_path,record)
+        return y,x
+    
+    def __choose_move(self,grid):
+        """
+        Chooses a move with the player's algorithm, answering from the opening book first if there is one.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        if self.book is not None and self.player_algorithm in BOOK_ALGORITHMS:
+            x = self.book.lookup(self.__to_bitboard(grid),self.player_number)
+            if x is not None:
+                self.nodes = 0
+                return self.get_row(x,grid),x
         if self.player_algorithm=='Random':
             return(self.__random(grid))
         elif self.player_algorithm=='Minimax':
             return(self.__minimax_move(grid,False))
         elif self.player_algorithm=='Minimax with A-B Pruning':
             return(self.__minimax_move(grid,True))
+        elif self.player_algorithm=='Principal Variation Search':
+            return self.__principal_variation(grid)
         elif self.player_algorithm=='Artificial Neural Network':
            return self.__convolutional_neural_net(grid)
+        elif self.player_algorithm=='Solver':
+            return self.__solve(grid)
+        elif self.player_algorithm=='MCTS':
+            return self.__monte_carlo(grid)
     
     def __random(self,grid):
         """
@@ -155,7 +491,7 @@ class Player:
         y = self.get_row(x,grid)
         return y,x
     
-    def __minimax_move(self,grid,is_alpha_beta):
+    def __minimax_move(self,grid,is_alpha_beta,timed=True):
         """
         Initiates the Minimax algorithm and obtains the optimal move from the algorithm.
 
@@ -165,6 +501,43 @@ class Player:
             Current state of the game.
         is_alpha_beta : bool
             Boolean value to determine if alpha-beta pruning is included in the algorithm.
+        timed : bool, optional
+            Deepen iteratively within time_limit_ms if it is set, rather than search to self.depth.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        self.is_alpha_beta = is_alpha_beta
+        self.__new_search()
+        timed = timed and self.time_limit_ms is not None
+        self.zero_horizon = self.depth==8 and not timed     #Iterative deepening evaluates every depth
+        if timed:
+            return self.__iterative_deepening(grid)
+        board = self.__new_board(grid)
+        if self.workers>1 and self.depth>1:
+            x,score = self.__parallel_root(board,grid)
+        else:
+            x,score = self.__minimax(self.depth, -math.inf, math.inf, board, True)
+        self.completed_depth = self.depth
+        self.last_score = score
+        y = self.get_row(x,grid)
+        return y,x
+    
+    def __solve(self,grid):
+        """
+        Finds a move with perfect play using connect4_solver. If the position cannot
+        be solved within time_limit_ms, or SOLVER_TIME_MS when it is not set, as in the
+        opening, the move is found by a Minimax with A-B Pruning search to the player's
+        depth instead, solution is None and fallbacks is counted up.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
 
         Returns
         -------
@@ -173,12 +546,309 @@ class Player:
         x : int
             Column at which the disc should be played to.
         """
+        if self.solver is None:
+            self.solver = solver.Solver(self.table_size_mb or tt.DEFAULT_SIZE_MB,self.endgame_table)
+        board = self.__to_bitboard(grid)
+        time_limit_ms = self.time_limit_ms if self.time_limit_ms is not None else SOLVER_TIME_MS
+        deadline = time.perf_counter() + time_limit_ms/1000
+        nodes = self.solver.nodes
+        try:
+            x,score = self.solver.best_move(board,self.player_number,deadline)
+        except solver.SolveTimeout:
+            self.solution = None
+            self.fallbacks += 1
+            return self.__minimax_move(grid,True,timed=False)
+        self.nodes = self.solver.nodes - nodes
+        self.last_score = score
+        self.solution = solver.outcome(score,board.counter)
+        y = self.get_row(x,grid)
+        return y,x
+    
+    def __monte_carlo(self,grid):
+        """
+        Chooses a move by Monte Carlo Tree Search, running self.playouts playouts or
+        until time_limit_ms is spent. The tree is kept for the next move.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        if self.mcts is None:
+            self.mcts = mcts.MCTS(self.checkpoint if self.mcts_prior else None)
+        deadline = None
+        if self.time_limit_ms is not None:
+            deadline = time.perf_counter() + self.time_limit_ms/1000
+        playouts = self.mcts.playouts
+        x,win_rate = self.mcts.best_move(self.__to_bitboard(grid),self.player_number,self.playouts,deadline)
+        self.nodes = self.mcts.playouts - playouts
+        self.last_score = win_rate
+        y = self.get_row(x,grid)
+        return y,x
+    
+    def ponder(self,grid,predicted=None):
+        """
+        Searches on the opponent's time until the ponder is stopped or cancel is called. The position after
+        each reply the opponent could make is searched as this player's next move
+        would be, so the results are in the transposition table when the opponent
+        has moved. With a time limit the replies are searched one ply deeper each
+        round. Only the Minimax algorithms with a transposition table ponder.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game, with the opponent to move.
+        predicted : int, optional
+            Reply expected from the opponent, searched first.
+
+        Returns
+        -------
+        None.
+        """
+        if self.player_algorithm not in BOOK_ALGORITHMS or self.transposition_table is None:
+            return
+        self.is_alpha_beta = self.player_algorithm!='Minimax'
+        self.zero_horizon = self.depth==8 and self.time_limit_ms is None
+        board = self.__new_board(grid)
+        if self.time_limit_ms is None:
+            depths = [self.depth]
+        else:
+            depths = range(1,42-board.counter)
+        try:
+            replies = board.get_possible_columns()
+            if predicted in replies:
+                replies.remove(predicted)
+                replies.insert(0,predicted)
+            for depth in depths:
+                for x in replies:
+                    if board.is_winning_move(x,self.opponent_number):
+                        continue
+                    board.play(x,self.opponent_number)
+                    start = time.perf_counter()
+                    self.__new_search()     #Each reply is searched as its move would be
+                    self.__minimax(depth, -math.inf, math.inf, board, True)
+                    self.ponder_searches[board.hash] = self.ponder_searches.get(board.hash,0.0) + time.perf_counter() - start
+                    board.undo()
+        except SearchTimeout:
+            pass
+    
+    def __to_bitboard(self,grid,track_evaluation=False):
+        """
+        Creates a bitboard of the game, from the bitboards of a Board when given one
+        rather than by reading its grid.
+
+        Parameters
+        ----------
+        grid : list, numpy array or Board
+            Current state of the game.
+        track_evaluation : bool, optional
+            Keep the heuristic evaluation up to date as moves are played.
+
+        Returns
+        -------
+        Bitboard
+            Bitboard holding the same discs.
+        """
+        if isinstance(grid,game_board.Board):
+            return grid.to_bitboard(track_evaluation)
+        return bb.Bitboard.from_grid(grid,track_evaluation)
+    
+    def __new_board(self,grid):
+        """
+        Creates the bitboard searched by Minimax, instrumented if the player is.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        board : Bitboard
+            Bitboard of the grid, tracking the evaluation unless the horizon scores 0.
+        """
+        if self.recording is None:
+            return self.__to_bitboard(grid,not self.zero_horizon)   #A zero horizon never evaluates, so skips tracking it
+        board = instrumentation.InstrumentedBitboard.from_grid(grid,not self.zero_horizon)
+        board.stats = self.recording
+        return board
+    
+    def __new_search(self):
+        """
+        Resets the node count and move ordering tables before searching a new move.
+
+        Returns
+        -------
+        None.
+        """
+        self.nodes = 0
+        if self.transposition_table is not None:
+            self.transposition_table.new_search()
+        if self.move_ordering and self.is_alpha_beta:
+            self.killers = [[None, None] for n in range(43)]
+            self.history = [[0]*(7*bb.COLUMN_BITS), [0]*(7*bb.COLUMN_BITS)]
+    
+    def __parallel_root(self,board,grid):
+        """
+        Searches the root columns across worker processes. The first column is searched
+        here to obtain alpha, then the remaining columns are searched in parallel with
+        that bound. The columns are narrowed and ordered as the serial search would at
+        the root, and ties go to the column searched first, so the same move is returned.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        grid : list
+            Current state of the game, as sent to the workers.
+
+        Returns
+        -------
+        best_move : int
+            Column at which the disc should be played to.
+        max_score : int
+            The value associated to the move.
+        """
+        if self.is_alpha_beta:
+            key = board.hash if self.transposition_table is not None else None
+            columns,result = self.__search_order(board,self.depth,True,key)
+            if result is not None:
+                return columns[0], result
+        else:
+            columns = board.get_possible_columns()
+        board.play(columns[0],self.player_number)
+        move,max_score = self.__minimax(self.depth-1, -math.inf, math.inf, board, False)
+        board.undo()
+        best_move = columns[0]
+        if len(columns)==1 or max_score==math.inf:
+            return best_move, max_score
+        
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        alpha = max_score if self.is_alpha_beta else -math.inf
+        config = (self.player_number,self.opponent_number,self.player_algorithm,self.depth,self.table_size_mb,
+                  self.move_ordering,self.forced_moves)
+        futures = [self.pool.submit(_search_root_column,config,grid,x,alpha,self.is_alpha_beta) for x in columns[1:]]
+        for x,future in zip(columns[1:],futures):
+            score,nodes = future.result()
+            self.nodes += nodes
+            if score>max_score:     #Only a higher score replaces a column searched before it, as in the serial search
+                best_move = x
+                max_score = score
+        return best_move, max_score
+    
+    def _search_column(self,grid,x,alpha,is_alpha_beta):
+        """
+        Searches the position after playing a root column. Used by the worker processes
+        of the parallel search.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+        x : int
+            Root column to play before searching.
+        alpha : int
+            Best score already found at the root.
+        is_alpha_beta : bool
+            Boolean value to determine if alpha-beta pruning is included in the algorithm.
+
+        Returns
+        -------
+        score : int
+            The value associated to the column.
+        nodes : int
+            Number of positions searched.
+        """
         self.is_alpha_beta = is_alpha_beta
-        x,score = self.__minimax(self.depth, -math.inf, math.inf, grid, True)
+        self.__new_search()
+        self.zero_horizon = self.depth==8 and self.time_limit_ms is None
+        board = self.__new_board(grid)
+        board.play(x,self.player_number)
+        move,score = self.__minimax(self.depth-1, alpha, math.inf, board, False)
+        return score,self.nodes
+    
+    def get_column_scores(self,grid,is_alpha_beta=True):
+        """
+        Scores every column with the Minimax search, each with a full window so the
+        scores are exact rather than bounds.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+        is_alpha_beta : bool, optional
+            Boolean value to determine if alpha-beta pruning is included in the algorithm.
+
+        Returns
+        -------
+        scores : list
+            The value of playing each column 0-6, NaN for full columns.
+        best_move : int
+            The column the search would play: the first highest score in the
+            centre-out order the search uses.
+        """
+        self.is_alpha_beta = is_alpha_beta
+        self.__new_search()
+        self.zero_horizon = self.depth==8 and self.time_limit_ms is None
+        board = self.__new_board(grid)
+        scores = [math.nan] * 7
+        best_move = None
+        for x in board.get_possible_columns():
+            board.play(x,self.player_number)
+            move,scores[x] = self.__minimax(self.depth-1, -math.inf, math.inf, board, False)
+            board.undo()
+            if best_move is None or scores[x]>scores[best_move]:
+                best_move = x
+        return scores,best_move
+    
+    def __iterative_deepening(self,grid):
+        """
+        Searches to depth 1, 2, 3... until the time budget for the move is spent,
+        trying the best move of the previous depth first.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to, from the deepest
+            search that completed.
+        """
+        start = time.perf_counter()
+        empty_cells = 42 - int(np.count_nonzero(grid))
+        x = None
+        self.completed_depth = 0
+        for depth in range(1,empty_cells+1):
+            if depth>1:     #Depth 1 always completes so there is a move to return
+                self.deadline = start + self.time_limit_ms/1000
+            board = self.__new_board(grid)
+            try:
+                x,score = self.__minimax(depth, -math.inf, math.inf, board, True, x)
+            except SearchTimeout:
+                break
+            finally:
+                self.deadline = None
+            self.completed_depth = depth
+            self.last_score = score
+            if score in (math.inf,-math.inf) or time.perf_counter()-start>=self.time_limit_ms/1000:
+                break
         y = self.get_row(x,grid)
         return y,x
     
-    def __minimax(self,depth,alpha,beta,grid,is_maximiser): 
+    def __minimax(self,depth,alpha,beta,board,is_maximiser,first_move=None): 
         """
         Function that performs the Minimax algorithm, as well as having alpha-beta pruning.
 
@@ -190,10 +860,12 @@ class Player:
             Initial value of alpha for alpha-beta pruning.
         beta : int
             Initial value of beta for alpha-beta pruning.
-        grid : int
-            Current state of the game.
+        board : Bitboard
+            Current state of the game. Moves are played and taken back in place.
         is_maximiser : BOOLEAN
             Boolean value to tell the algorithm to maximise or minimise.
+        first_move : int, optional
+            Column to search before the others, e.g. the best move of a shallower search.
 
         Returns
         -------
@@ -202,52 +874,463 @@ class Player:
         value : int
             The value associated to the move.
         """
-        if is_victory(grid,self.player_number):
-            return 0, math.inf
-        elif is_victory(grid,self.opponent_number):
-            return 0, -math.inf
-        elif is_grid_full(grid):
+        self.nodes += 1
+        if self.nodes & 255==0 and (self.cancelled or self.ponder_stop or self.deadline is not None and time.perf_counter()>self.deadline):
+            raise SearchTimeout
+        if board.last_move_won():   #Only the player who just moved can have won
+            return 0, -math.inf if is_maximiser else math.inf
+        elif board.is_full():
             return 0, 0
         elif depth==0:
-            if self.depth==8:
+            if self.zero_horizon:
                 return 0, 0
             else:
-                return 0,self.__grid_evaluation(grid)
+                return 0,board.evaluate(self.player_number,self.opponent_number)
         
-        columns = self.get_possible_columns(grid)
+        table = self.transposition_table
+        if table is not None:
+            key = board.hash if is_maximiser else board.hash ^ bb.SIDE_KEY
+            entry = table.probe(key,depth)
+            if entry is not None:
+                flag,value,move = entry
+                if flag==tt.EXACT or (flag==tt.LOWER and value>=beta) or (flag==tt.UPPER and value<=alpha):
+                    return move, value
+            alpha_original,beta_original = alpha,beta
+        
+        if self.is_alpha_beta:
+            columns,result = self.__search_order(board,depth,is_maximiser,key if table is not None else None)
+            if result is not None:
+                return columns[0], result if is_maximiser else -result
+        else:
+            columns = board.get_possible_columns()
+        if first_move in columns:
+            columns.remove(first_move)
+            columns.insert(0,first_move)
         best_move = columns[0]
         
         if is_maximiser:
             max_score = -math.inf
             for x in columns:
-                y = self.get_row(x,grid)
-                copied_grid = copy.deepcopy(grid) 
-                copied_grid[y][x] = self.player_number
-                move,score = self.__minimax(depth-1, alpha, beta, copied_grid, False)
+                board.play(x,self.player_number)
+                move,score = self.__minimax(depth-1, alpha, beta, board, False)
+                board.undo()
                 if score>max_score:
                     best_move = x
                     max_score = score
                 if self.is_alpha_beta:
                     alpha = max(alpha,max_score)
                     if alpha>=beta:
+                        if self.recording is not None:
+                            self.recording.cutoffs += 1
+                        if self.move_ordering:
+                            self.__record_cutoff(board,x,depth,self.player_number)
                         break
+            if table is not None:
+                self.__store(table,key,depth,alpha_original,beta_original,max_score,best_move)
             return best_move, max_score
         else:
             min_score = math.inf
             for x in columns:
-                y = self.get_row(x,grid)
-                copied_grid = copy.deepcopy(grid)
-                copied_grid[y][x] = self.opponent_number
-                move,score = self.__minimax(depth-1, alpha, beta, copied_grid, True)
+                board.play(x,self.opponent_number)
+                move,score = self.__minimax(depth-1, alpha, beta, board, True)
+                board.undo()
                 if score<min_score:
                     best_move = x
                     min_score = score
                 if self.is_alpha_beta:
                     beta = min(beta,min_score)
                     if beta<=alpha:
+                        if self.recording is not None:
+                            self.recording.cutoffs += 1
+                        if self.move_ordering:
+                            self.__record_cutoff(board,x,depth,self.opponent_number)
                         break
+            if table is not None:
+                self.__store(table,key,depth,alpha_original,beta_original,min_score,best_move)
             return best_move, min_score
 
+    def __principal_variation(self,grid):
+        """
+        Chooses a move by principal variation search. The root is searched with an
+        aspiration window around the score of the player's last move, or, with
+        time_limit_ms set, one ply deeper at a time around the score of the depth
+        before until the budget is spent.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+
+        Returns
+        -------
+        y : int
+            Height at which the disc should be played to.
+        x : int
+            Column at which the disc should be played to.
+        """
+        self.is_alpha_beta = True
+        self.__new_search()
+        self.zero_horizon = self.depth==8 and self.time_limit_ms is None
+        start = time.perf_counter()
+        if self.time_limit_ms is None:
+            depths = [self.depth]
+            score = self.last_score     #Two plies on at the same depth, usually a close guess
+        else:
+            depths = range(1,43-int(np.count_nonzero(grid)))
+            score = None
+        x = None
+        self.completed_depth = 0
+        for depth in depths:
+            if depth>1 and self.time_limit_ms is not None:     #Depth 1 always completes so there is a move to return
+                self.deadline = start + self.time_limit_ms/1000
+            board = self.__new_board(grid)
+            try:
+                x,score = self.__aspiration(depth,board,score,x)
+            except SearchTimeout:
+                if x is None:   #Cancelled rather than out of time
+                    raise
+                break
+            finally:
+                self.deadline = None
+            self.completed_depth = depth
+            self.last_score = score
+            if score in (math.inf,-math.inf):   #A deeper search finds the same forced result
+                break
+            if self.time_limit_ms is not None and time.perf_counter()-start>=self.time_limit_ms/1000:
+                break
+        y = self.get_row(x,grid)
+        return y,x
+    
+    def __aspiration(self,depth,board,guess,first_move):
+        """
+        Searches the root within ASPIRATION_WINDOW of a guessed score, widening the
+        window on the side the score fell outside of until it is inside.
+
+        Parameters
+        ----------
+        depth : int
+            Depth to search to.
+        board : Bitboard
+            Current state of the game.
+        guess : int or None
+            Expected score, e.g. from the previous depth. None searches a full window.
+        first_move : int or None
+            Column to search first.
+
+        Returns
+        -------
+        best_move : int
+            Column at which the disc should be played to.
+        score : int
+            The value associated to the move.
+        """
+        if guess is None or guess in (math.inf,-math.inf):
+            return self.__negamax(depth, -math.inf, math.inf, board, True, first_move)
+        alpha,beta = guess-ASPIRATION_WINDOW,guess+ASPIRATION_WINDOW
+        while True:
+            move,score = self.__negamax(depth, alpha, beta, board, True, first_move)
+            if score<=alpha and alpha>-math.inf:
+                alpha = -math.inf
+            elif score>=beta and beta<math.inf:
+                beta = math.inf
+            else:
+                return move,score
+    
+    def __negamax(self,depth,alpha,beta,board,is_maximiser,first_move=None):
+        """
+        Negamax form of the alpha-beta search with principal variation search: the
+        first move is searched with the full window and the rest with a null window
+        around alpha, re-searched with the full window only if they beat it. Scores
+        are from the point of view of the player to move, and the transposition table
+        is shared with Minimax, whose entries are from this player's point of view.
+
+        Parameters
+        ----------
+        depth : int
+            Depth that the algorithm should explore the game tree to.
+        alpha : int
+            Score the player to move is already assured of.
+        beta : int
+            Score the opponent is already assured of.
+        board : Bitboard
+            Current state of the game. Moves are played and taken back in place.
+        is_maximiser : bool
+            True if it is this player's move.
+        first_move : int, optional
+            Column to search before the others, e.g. the best move of a shallower search.
+
+        Returns
+        -------
+        optimal_move : int
+            The optimal column that should be played to.
+        value : int
+            The value associated to the move, for the player to move.
+        """
+        self.nodes += 1
+        if self.nodes & 255==0 and (self.cancelled or self.ponder_stop or self.deadline is not None and time.perf_counter()>self.deadline):
+            raise SearchTimeout
+        sign = 1 if is_maximiser else -1
+        if board.last_move_won():   #The player who just moved has won
+            return 0, -math.inf
+        elif board.is_full():
+            return 0, 0
+        elif depth==0:
+            if self.zero_horizon:
+                return 0, 0
+            else:
+                return 0, sign*board.evaluate(self.player_number,self.opponent_number)
+        
+        table = self.transposition_table
+        if table is not None:
+            key = board.hash if is_maximiser else board.hash ^ bb.SIDE_KEY
+            entry = table.probe(key,depth)
+            if entry is not None:
+                flag,value,move = entry
+                value = sign*value
+                if not is_maximiser and flag!=tt.EXACT:     #A lower bound for this player is an upper bound for the opponent
+                    flag = tt.UPPER if flag==tt.LOWER else tt.LOWER
+                if flag==tt.EXACT or (flag==tt.LOWER and value>=beta) or (flag==tt.UPPER and value<=alpha):
+                    return move, value
+            alpha_original,beta_original = alpha,beta
+        
+        mover = self.player_number if is_maximiser else self.opponent_number
+        columns,result = self.__search_order(board,depth,is_maximiser,key if table is not None else None)
+        if result is not None:
+            return columns[0], result
+        if first_move in columns:
+            columns.remove(first_move)
+            columns.insert(0,first_move)
+        best_move = columns[0]
+        best_score = -math.inf
+        for x in columns:
+            board.play(x,mover)
+            if x==columns[0] or alpha==-math.inf:
+                move,score = self.__negamax(depth-1, -beta, -alpha, board, not is_maximiser)
+                score = -score
+            else:
+                move,score = self.__negamax(depth-1, -alpha-1, -alpha, board, not is_maximiser)
+                score = -score
+                if alpha<score<beta:    #Better than the principal variation, so find its exact score
+                    bound = score
+                    move,score = self.__negamax(depth-1, -beta, -bound, board, not is_maximiser)
+                    score = max(-score,bound)   #Failing low means the score is the bound
+            board.undo()
+            if score>best_score:
+                best_move = x
+                best_score = score
+            alpha = max(alpha,best_score)
+            if alpha>=beta:
+                if self.recording is not None:
+                    self.recording.cutoffs += 1
+                if self.move_ordering:
+                    self.__record_cutoff(board,x,depth,mover)
+                break
+        if table is not None:
+            if is_maximiser:
+                self.__store(table,key,depth,alpha_original,beta_original,best_score,best_move)
+            else:
+                self.__store(table,key,depth,-beta_original,-alpha_original,-best_score,best_move)
+        return best_move, best_score
+    
+    def __search_order(self,board,depth,is_maximiser,key):
+        """
+        Gets the columns the alpha-beta searches play from a position, in the order
+        they are searched: narrowed by __forced_moves and sorted by __order_moves when
+        those are turned on, otherwise all of them in centre-out order.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        depth : int
+            Remaining depth of the search.
+        is_maximiser : bool
+            True if it is this player's move.
+        key : int or None
+            Transposition table key of the position, None without a table.
+
+        Returns
+        -------
+        columns : list
+            The columns to search.
+        result : float or None
+            inf if the player to move wins with the first column, -inf if they lose
+            whatever they play, otherwise None.
+        """
+        columns = board.get_possible_columns()
+        if self.forced_moves:
+            if is_maximiser:
+                columns,result = self.__forced_moves(board,depth,self.player_number,self.opponent_number,columns)
+            else:
+                columns,result = self.__forced_moves(board,depth,self.opponent_number,self.player_number,columns)
+            if result is not None:
+                return columns, result
+        if self.move_ordering and len(columns)>1:
+            tt_move = self.transposition_table.get_move(key) if key is not None else None
+            columns = self.__order_moves(board,columns,is_maximiser,tt_move)
+        return columns, None
+    
+    def __forced_moves(self,board,depth,mover,other,columns):
+        """
+        Narrows the columns to search using the lines of 4 about to be completed: a
+        column that wins at once decides the position, a single cell the opponent
+        would win on must be blocked, two such cells cannot both be blocked, and a
+        column under a cell the opponent would win on hands them the game. Every
+        column left out loses within two plies, so the score of the position is
+        unchanged when the search has the depth to see it.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        depth : int
+            Remaining depth of the search, at least 1. Blocks and losing moves are
+            only pruned from depth 2, where the search would see the opponent win.
+        mover : int
+            Value of the player to move.
+        other : int
+            Value of their opponent.
+        columns : list
+            Playable columns in the order they would be searched.
+
+        Returns
+        -------
+        columns : list
+            The columns left to search, in the same order.
+        result : float or None
+            inf if the player to move wins with the first column, -inf if they lose
+            whatever they play, otherwise None.
+        """
+        heights = board.heights
+        playable = board.playable_cells()
+        wins = board.winning_cells(mover) & playable
+        if wins:
+            return [x for x in columns if wins >> heights[x] & 1], math.inf
+        if depth<2:
+            return columns, None
+        threats = board.winning_cells(other)
+        blocks = threats & playable
+        if blocks:
+            if blocks & (blocks - 1):   #Two threats cannot both be blocked
+                return columns, -math.inf
+            return [x for x in columns if blocks >> heights[x] & 1], None
+        safe = [x for x in columns if not threats >> (heights[x]+1) & 1]   #Not under a cell the opponent would win on
+        if not safe:
+            return columns, -math.inf
+        return safe, None
+    
+    def __order_moves(self,board,columns,is_maximiser,tt_move):
+        """
+        Orders the columns to search so that cut-offs come early: immediate wins,
+        then the transposition table's best move, then blocks of the opponent's
+        immediate wins, then killer moves, then the rest by history score. Columns
+        that tie keep the centre-out order.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        columns : list
+            Playable columns in centre-out order.
+        is_maximiser : bool
+            True if it is this player's move.
+        tt_move : int or None
+            Best move stored in the transposition table for the position.
+
+        Returns
+        -------
+        list
+            The columns in the order they should be searched.
+        """
+        if is_maximiser:
+            mover,other = self.player_number,self.opponent_number
+        else:
+            mover,other = self.opponent_number,self.player_number
+        playable = board.playable_cells()
+        if self.forced_moves:   #__forced_moves has already returned on any win
+            wins = 0
+        else:
+            wins = board.winning_cells(mover) & playable
+        blocks = board.winning_cells(other) & playable
+        killers = self.killers[board.counter]
+        history = self.history[mover-1]
+        heights = board.heights
+        priorities = {}
+        for x in columns:
+            cell = heights[x]
+            if wins >> cell & 1:
+                priorities[x] = (0,0)
+            elif x==tt_move:
+                priorities[x] = (1,0)
+            elif blocks >> cell & 1:
+                priorities[x] = (2,0)
+            elif x==killers[0]:
+                priorities[x] = (3,0)
+            elif x==killers[1]:
+                priorities[x] = (4,0)
+            else:
+                priorities[x] = (5,-history[cell])
+        return sorted(columns,key=priorities.__getitem__)
+    
+    def __record_cutoff(self,board,x,depth,mover):
+        """
+        Remembers a move that caused a cut-off as a killer move for this number of
+        discs and raises its history score.
+
+        Parameters
+        ----------
+        board : Bitboard
+            State of the game the move was played from.
+        x : int
+            Column that caused the cut-off.
+        depth : int
+            Remaining depth of the search, deeper cut-offs count for more.
+        mover : int
+            Value of the player who played the move.
+
+        Returns
+        -------
+        None.
+        """
+        killers = self.killers[board.counter]
+        if killers[0]!=x:
+            killers[1] = killers[0]
+            killers[0] = x
+        self.history[mover-1][board.heights[x]] += depth*depth
+    
+    def __store(self,table,key,depth,alpha,beta,score,move):
+        """
+        Stores a searched position in the transposition table with its bound type.
+
+        Parameters
+        ----------
+        table : TranspositionTable
+            Table to store the position in.
+        key : int
+            Hash of the position (including the side to move).
+        depth : int
+            Remaining depth the position was searched to.
+        alpha : int
+            Value of alpha when the position was entered.
+        beta : int
+            Value of beta when the position was entered.
+        score : int
+            Score found for the position.
+        move : int
+            Best column found for the position.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.is_alpha_beta or alpha<score<beta:
+            flag = tt.EXACT
+        elif score<=alpha:
+            flag = tt.UPPER
+        else:
+            flag = tt.LOWER
+        table.store(key,depth,flag,score,move)
+
     def __user(self):
         """
         Function to enable user gameplay.
@@ -278,77 +1361,63 @@ class Player:
             The overall score associated to the game state.
         """
 
-        score = 0
-        #Centre column is worth extra value, as allows wins in both directions
-        score += np.count_nonzero(grid[:,3]==self.player_number) * 2
-        for x in range(3,7):
-            for y in range(3):
-                items = [grid[y][x],grid[y+1][x-1],grid[y+2][x-2],grid[y+3][x-3]]
-                score += self.__score_evaluation(items)
-        for x in range(3,7):
-           for y in range(3,6):
-               items = [grid[y][x],grid[y-1][x-1],grid[y-2][x-2],grid[y-3][x-3]]
-               score += self.__score_evaluation(items)
-               
-        for y in range(6):
-            row = grid[y]      #Obtains row of Connect4 to perform checks for across
-            for x in range(3):
-                items = row[x:x+4] #Separates row into 4, and performs the counts below
-                score += self.__score_evaluation(items)
-                
-        for x in range(7):
-            column = grid[:,x] #Obtains column of Connect4 to perform checks for upward/downward
-            for y in range(3):
-                items = column[y:y+4]
-                score += self.__score_evaluation(items)
-        return score
-    
-    def __score_evaluation(self,items):
-        """
-        Scores the discs that are connected based upon how many there are of the same type.
+        board = self.__to_bitboard(grid)
+        return board.evaluate(self.player_number,self.opponent_number)
+
+    def __convolutional_neural_net(self,grid):
+        """
+        Function that chooses the legal column the CNN scores highest.
 
         Parameters
         ----------
-        items : int
-            A list of 4, connecting values from the grid.
+        grid : list
+            Current state of the game.
 
         Returns
         -------
-        score : int
-            The score determined from list items.
+        y : int
+            Height at which the disc should be played to.
+        column : int
+            Column at which the disc should be played to.
         """
-        score = 0    
-        # I believe this works better than: += 25, +=15, -=30, -=10
-        if np.count_nonzero(items==self.player_number)==3 and np.count_nonzero(items==0)==1:
-            score += 5
-        elif np.count_nonzero(items==self.player_number)==2 and np.count_nonzero(items==0)==2:
-            score += 3
-
-        if np.count_nonzero(items==self.opponent_number)==3 and np.count_nonzero(items==0)==1:
-           score -= 4
-        elif np.count_nonzero(items==self.opponent_number)==2 and np.count_nonzero(items==0)==2:
-            score -= 2
-        return score
-
-    def __convolutional_neural_net(self,grid):
-        device = 'cpu'
-        cnn_state_dict = torch.load('cnnmodel.pt')
-        self.cnn.load_state_dict(cnn_state_dict) 
-        data = torch.tensor(grid).float().flatten()
-        data = data.view(1,1,6,7)
-        data.to(device)
-        output = self.cnn(data)
-        output = output.detach().numpy()[0]
-        
-        max_val = -math.inf
-        for x in range(len(output)):
-            y = self.get_row(x,grid)
-            if grid[y][x]==0 and output[x]>max_val:
-                column = x
-                max_val = output[x]
+        cnn = neural_net.load_model(self.checkpoint)
+        column = int(inference.best_columns(cnn,np.asarray(grid)[np.newaxis])[0])
         y = self.get_row(column,grid)
         return y,column
 
+_worker_players = {}     #Players kept by each worker process so their tables last between moves
+
+def _search_root_column(config,grid,x,alpha,is_alpha_beta):
+    """
+    Searches one root column in a worker process of the parallel search.
+
+    Parameters
+    ----------
+    config : tuple
+        Player value, opponent value, algorithm, depth, table size, move ordering and
+        forced-move settings of the searching player.
+    grid : list
+        Current state of the game.
+    x : int
+        Root column to search.
+    alpha : int
+        Best score already found at the root.
+    is_alpha_beta : bool
+        Boolean value to determine if alpha-beta pruning is included in the algorithm.
+
+    Returns
+    -------
+    tuple
+        The score of the column and the number of positions searched.
+    """
+    player = _worker_players.get(config)
+    if player is None:
+        value,opp_value,algorithm_value,depth,table_size_mb,move_ordering,forced_moves = config
+        player = Player(value,opp_value,algorithm_value,depth,None,table_size_mb=table_size_mb,persist_table=True,
+                        move_ordering=move_ordering,forced_moves=forced_moves)
+        _worker_players[config] = player
+    return player._search_column(grid,x,alpha,is_alpha_beta)
+
 def is_victory(grid,val):
     """
     Checks the game for winning states.
@@ -365,27 +1434,11 @@ def is_victory(grid,val):
     bool
         Returns True if there is a winning state.
     """
-    for y in range(6):
-        row = grid[y]
-        for x in range(4):
-            items = row[x:x+4]
-            if np.count_nonzero(items==val)==4:
-                return True
-    for x in range(7):
-        column = grid[:,x]
-        for y in range(3):
-            items = column[y:y+4]
-            if np.count_nonzero(items==val)==4:
-                return True
-    for x in range(3,7):
-        for y in range(3):
-            if grid[y][x]==val and grid[y+1][x-1]==val and grid[y+2][x-2]==val and grid[y+3][x-3]==val:
-                return True
-    for x in range(3,7):
-       for y in range(3,6):
-           if grid[y][x]==val and grid[y-1][x-1]==val and grid[y-2][x-2]==val and grid[y-3][x-3]==val:
-               return True
-   
+    for line in bb.WINNING_LINES:
+        if all(grid[y][x]==val for y,x in line):
+            return True
+    return False
+
 def is_grid_full(grid):
     """
     Determines if the grid is full (resulting in a draw)
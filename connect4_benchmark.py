@@ -0,0 +1,524 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the Connect 4 algorithms: search speed at each depth, win check and
+evaluation micro-benchmarks, CNN latency and game throughput. Positions come from
+fixed seeds, so results can be compared between versions.
+
+Run with: python connect4_benchmark.py --output results.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import torch
+
+import connect4_algorithms as al
+import connect4_bitboard as bb
+import connect4_inference as inference
+import connect4_simulation as sim
+import connect4_transposition as tt
+import neural_net_trainer as neural_net
+
+PHASES = {  #Discs on the board for each phase of the game
+    'opening': (4, 8),
+    'midgame': (12, 18),
+    'endgame': (24, 30),
+}
+
+def benchmark_positions(count,min_plies,max_plies,seed=4801):
+    """
+    Generates a fixed set of positions by playing random moves, skipping any game
+    that is already won.
+
+    Parameters
+    ----------
+    count : int
+        Number of positions to generate.
+    min_plies : int
+        Fewest discs a position can have.
+    max_plies : int
+        Most discs a position can have.
+    seed : int, optional
+        Seed of the generator, so the same positions are produced every run.
+
+    Returns
+    -------
+    positions : list
+        (grid, value of the player to move) pairs.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions)<count:
+        board = bb.Bitboard()
+        val = 1
+        for n in range(rng.randint(min_plies,max_plies)):
+            x = rng.choice(board.get_possible_columns())
+            if board.is_winning_move(x,val):
+                break
+            board.play(x,val)
+            val = 3 - val
+        else:
+            positions.append((board.to_grid(),val))
+    return positions
+
+def phase_positions(count,seed=4801):
+    """
+    Generates the fixed benchmark positions of each phase of the game.
+
+    Parameters
+    ----------
+    count : int
+        Number of positions per phase.
+    seed : int, optional
+        Seed of the positions.
+
+    Returns
+    -------
+    dict
+        (grid, value of the player to move) pairs, by phase name.
+    """
+    return {phase: benchmark_positions(count,low,high,seed) for phase,(low,high) in PHASES.items()}
+
+def _per_call(function,items,repeats):
+    """
+    Times a function over a list of arguments.
+
+    Parameters
+    ----------
+    function : function
+        Function taking one item.
+    items : list
+        Arguments to call it with.
+    repeats : int
+        Times to go over the list.
+
+    Returns
+    -------
+    float
+        Microseconds per call.
+    """
+    start = time.perf_counter()
+    for repeat in range(repeats):
+        for item in items:
+            function(item)
+    return 1e6 * (time.perf_counter() - start) / (repeats * len(items))
+
+def search_speed(depths=(2,4,6,8),algorithms=('Minimax','Minimax with A-B Pruning','Principal Variation Search'),count=5,seed=4801):
+    """
+    Measures the nodes per second and time per move of the Minimax search for each
+    phase of the game, depth and algorithm. Depth 8 is the depth the players search
+    by default.
+
+    Parameters
+    ----------
+    depths : tuple, optional
+        Search depths to measure.
+    algorithms : tuple, optional
+        Any of 'Minimax', 'Minimax with A-B Pruning' and 'Principal Variation Search'.
+    count : int, optional
+        Number of positions per phase.
+    seed : int, optional
+        Seed of the positions.
+
+    Returns
+    -------
+    results : list
+        One dict per phase, algorithm and depth with the nodes, seconds, nodes per
+        second and milliseconds per move.
+    """
+    results = []
+    for phase,positions in phase_positions(count,seed).items():
+        for algorithm in algorithms:
+            for depth in depths:
+                nodes = 0
+                seconds = 0.0
+                for grid,val in positions:
+                    player = al.Player(val,3-val,algorithm,depth,None)
+                    start = time.perf_counter()
+                    player.use_player_algorithm(grid)
+                    seconds += time.perf_counter() - start
+                    nodes += player.nodes
+                results.append({
+                    'phase': phase,
+                    'algorithm': algorithm,
+                    'depth': depth,
+                    'positions': len(positions),
+                    'nodes': nodes,
+                    'seconds': seconds,
+                    'nodes_per_second': nodes / seconds if seconds else 0.0,
+                    'ms_per_move': 1000 * seconds / len(positions),
+                })
+    return results
+
+def evaluation_speed(count=100,repeats=20,seed=4801):
+    """
+    Times the win checks and the heuristic evaluation on a fixed set of positions.
+
+    Parameters
+    ----------
+    count : int, optional
+        Number of positions per phase.
+    repeats : int, optional
+        Times each position is checked.
+    seed : int, optional
+        Seed of the positions.
+
+    Returns
+    -------
+    dict
+        Microseconds per call of is_victory (grid), Bitboard.has_won, Bitboard.from_grid,
+        the evaluation of a grid as the players score one (building its bitboard and
+        scanning it), Bitboard.evaluate scanning the board, as the search does
+        without tracking, and Bitboard.evaluate with the incremental tracking the
+        search uses.
+    """
+    positions = [position for phase in phase_positions(count,seed).values() for position in phase]
+    grids = [(grid.tolist(),val) for grid,val in positions]
+    boards = [(bb.Bitboard.from_grid(grid),val) for grid,val in positions]
+    tracked = [(bb.Bitboard.from_grid(grid,True),val) for grid,val in positions]
+    return {
+        'positions': len(positions),
+        'is_victory_us': _per_call(lambda item: al.is_victory(item[0],item[1]),grids,repeats),
+        'has_won_us': _per_call(lambda item: item[0].has_won(item[1]),boards,repeats),
+        'from_grid_us': _per_call(lambda item: bb.Bitboard.from_grid(item[0]),grids,repeats),
+        'grid_evaluation_us': _per_call(lambda item: bb.Bitboard.from_grid(item[0]).evaluate(item[1],3-item[1]),grids,repeats),
+        'evaluation_scan_us': _per_call(lambda item: item[0].evaluate(item[1],3-item[1]),boards,repeats),
+        'evaluation_incremental_us': _per_call(lambda item: item[0].evaluate(item[1],3-item[1]),tracked,repeats),
+    }
+
+def cnn_latency(count=256,repeats=5,checkpoint=neural_net.DEFAULT_CHECKPOINT,seed=4801):
+    """
+    Times the CNN choosing moves, one position at a time and in one batch.
+
+    Parameters
+    ----------
+    count : int, optional
+        Number of positions.
+    repeats : int, optional
+        Times the positions are evaluated.
+    checkpoint : str, optional
+        Model to time.
+    seed : int, optional
+        Seed of the positions.
+
+    Returns
+    -------
+    dict
+        Milliseconds per single position, microseconds per position in a batch of
+        count positions, and the threads torch used.
+    """
+    grids = np.stack([grid for grid,val in benchmark_positions(count,0,30,seed)])
+    cnn = neural_net.load_model(checkpoint)
+    inference.best_columns(cnn,grids)   #Warm up
+    single_us = _per_call(lambda grid: inference.best_columns(cnn,grid[np.newaxis]),list(grids),repeats)
+    start = time.perf_counter()
+    for repeat in range(repeats):
+        inference.best_columns(cnn,grids)
+    batch_us = 1e6 * (time.perf_counter() - start) / (repeats * count)
+    return {
+        'checkpoint': checkpoint,
+        'single_ms': single_us / 1000,
+        'batch_size': count,
+        'batched_us_per_position': batch_us,
+        'threads': torch.get_num_threads(),
+    }
+
+MATCHES = [     #Batch simulations timed by game_throughput, with their number of games
+    ([{'algorithm': 'Random', 'depth': 0}, {'algorithm': 'Random', 'depth': 0}], 100000),
+    ([{'algorithm': 'Artificial Neural Network', 'depth': 0}, {'algorithm': 'Random', 'depth': 0}], 1000),
+    ([{'algorithm': 'Minimax with A-B Pruning', 'depth': 2}, {'algorithm': 'Random', 'depth': 0}], 200),
+    ([{'algorithm': 'Minimax with A-B Pruning', 'depth': 4}, {'algorithm': 'Minimax with A-B Pruning', 'depth': 4}], 20),
+]
+
+def game_throughput(scale=1.0,workers=1):
+    """
+    Times batch simulations of a fixed set of matches.
+
+    Parameters
+    ----------
+    scale : float, optional
+        Multiplier of the number of games of each match.
+    workers : int, optional
+        Number of worker processes.
+
+    Returns
+    -------
+    results : list
+        One dict per match with the games played, seconds and games per second.
+    """
+    results = []
+    for configs,num_games in MATCHES:
+        num_games = max(1,int(num_games*scale))
+        batch = sim.run_batch(configs,num_games,workers=workers)
+        results.append({
+            'match': ' v '.join(config['algorithm']+(' (depth '+str(config['depth'])+')' if config['depth'] else '')
+                                for config in configs),
+            'games': batch['games'],
+            'seconds': batch['seconds'],
+            'games_per_second': batch['games'] / batch['seconds'],
+        })
+    return results
+
+def table_memory(size_mb=4,fills=3,seed=4801):
+    """
+    Fills a transposition table with stores of random positions and measures the
+    memory it takes, to check it keeps to the size it was given.
+
+    Parameters
+    ----------
+    size_mb : float, optional
+        Size the table is created with.
+    fills : int, optional
+        Stores per slot of the table, so almost every slot ends up taken.
+    seed : int, optional
+        Seed of the positions.
+
+    Returns
+    -------
+    dict
+        The size asked for, the memory measured once filled, the occupancy and
+        whether the table kept within the size.
+    """
+    rng = random.Random(seed)
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        table = tt.TranspositionTable(size_mb)
+        for n in range(fills*table.capacity):
+            table.store(rng.getrandbits(64),rng.randint(1,8),tt.EXACT,rng.randint(-1000,1000),rng.randrange(7))
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return {
+        'size_mb': size_mb,
+        'used_mb': used / 2**20,
+        'occupancy': table.get_stats()['occupancy'],
+        'within_size': used<=size_mb * 2**20,
+    }
+
+def run_suite(quick=False,parallel=False,depth=8,positions=4):
+    """
+    Runs every benchmark.
+
+    Parameters
+    ----------
+    quick : bool, optional
+        Use fewer positions, smaller depths and fewer games, for a fast check.
+    parallel : bool, optional
+        Include the root-parallel speedup, which needs several cores to mean anything.
+    depth : int, optional
+        Search depth of the parallel speedup.
+    positions : int, optional
+        Number of positions of the parallel speedup.
+
+    Returns
+    -------
+    dict
+        Results of each benchmark, with the versions and machine they were run on.
+    """
+    results = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'torch': torch.__version__,
+            'machine': platform.platform(),
+            'quick': quick,
+        },
+        'search': search_speed(depths=(2,4,8) if quick else (2,4,6,8),count=2 if quick else 5),
+        'evaluation': evaluation_speed(count=20 if quick else 100,repeats=5 if quick else 20),
+        'cnn': cnn_latency(count=64 if quick else 256,repeats=2 if quick else 5),
+        'games': game_throughput(scale=0.1 if quick else 1.0),
+        'move_ordering': move_ordering_nodes(depths=(4,6) if quick else (6,8),count=4 if quick else 10),
+        'forced_moves': forced_move_nodes(depths=(4,6) if quick else (6,8,10),count=4 if quick else 10),
+        'table_memory': table_memory(size_mb=1 if quick else 4),
+    }
+    if parallel:
+        results['parallel'] = parallel_speedup(depth=depth,count=positions)
+    return results
+
+def parallel_speedup(worker_counts=(1,2,4,8),depth=8,algorithm='Minimax with A-B Pruning',count=4,seed=4801):
+    """
+    Times the root-parallel Minimax search with different numbers of worker processes.
+
+    Parameters
+    ----------
+    worker_counts : tuple, optional
+        Numbers of workers to time.
+    depth : int, optional
+        Search depth.
+    algorithm : str, optional
+        'Minimax' or 'Minimax with A-B Pruning'.
+    count : int, optional
+        Number of benchmark positions.
+    seed : int, optional
+        Seed of the benchmark positions.
+
+    Returns
+    -------
+    results : list
+        One dict per worker count with the time taken, the speedup over the first
+        worker count and whether every move matched it.
+    """
+    positions = benchmark_positions(count,8,16,seed)
+    results = []
+    baseline_moves = None
+    for workers in worker_counts:
+        moves = []
+        seconds = 0.0
+        for grid,val in positions:
+            player = al.Player(val,3-val,algorithm,depth,None,workers=workers)
+            if workers>1:   #Start the pool before timing, as a game would only do this once
+                player.pool = ProcessPoolExecutor(max_workers=workers)
+                list(player.pool.map(abs,range(workers)))
+            start = time.perf_counter()
+            moves.append(player.use_player_algorithm(grid))
+            seconds += time.perf_counter() - start
+            player.close()
+        if baseline_moves is None:
+            baseline_moves = moves
+            baseline_seconds = seconds
+        results.append({
+            'workers': workers,
+            'seconds': seconds,
+            'speedup': baseline_seconds / seconds,
+            'moves_match': moves==baseline_moves,
+        })
+    return results
+
+def move_ordering_nodes(depths=(6,8),count=10,seed=4801):
+    """
+    Counts the positions the alpha-beta search visits with and without dynamic
+    move ordering, checking that the scores found are the same.
+
+    Parameters
+    ----------
+    depths : tuple, optional
+        Search depths to measure.
+    count : int, optional
+        Number of benchmark positions.
+    seed : int, optional
+        Seed of the benchmark positions.
+
+    Returns
+    -------
+    results : list
+        One dict per depth with the total nodes and seconds of each setting,
+        the node reduction and whether every score matched.
+    """
+    positions = benchmark_positions(count,4,16,seed)
+    results = []
+    for depth in depths:
+        totals = {}
+        for ordering in (False,True):
+            nodes = 0
+            seconds = 0.0
+            scores = []
+            for grid,val in positions:
+                player = al.Player(val,3-val,'Minimax with A-B Pruning',depth,None,move_ordering=ordering)
+                start = time.perf_counter()
+                player.use_player_algorithm(grid)
+                seconds += time.perf_counter() - start
+                nodes += player.nodes
+                scores.append(player.last_score)
+            totals[ordering] = (nodes,seconds,scores)
+        results.append({
+            'depth': depth,
+            'nodes_static': totals[False][0],
+            'nodes_ordered': totals[True][0],
+            'reduction': totals[False][0] / totals[True][0],
+            'seconds_static': totals[False][1],
+            'seconds_ordered': totals[True][1],
+            'scores_match': totals[False][2]==totals[True][2],
+        })
+    return results
+
+def forced_move_nodes(depths=(6,8,10),count=10,seed=4801):
+    """
+    Counts the positions the alpha-beta search visits with and without the
+    forced-move pruning (wins, blocks and moves under an opponent's winning cell),
+    checking that the scores found are the same.
+
+    Parameters
+    ----------
+    depths : tuple, optional
+        Search depths to measure.
+    count : int, optional
+        Number of benchmark positions.
+    seed : int, optional
+        Seed of the benchmark positions.
+
+    Returns
+    -------
+    results : list
+        One dict per depth with the total nodes and seconds of each setting,
+        the node reduction and whether every score matched.
+    """
+    positions = benchmark_positions(count,4,16,seed)
+    results = []
+    for depth in depths:
+        totals = {}
+        for forced in (False,True):
+            nodes = 0
+            seconds = 0.0
+            scores = []
+            for grid,val in positions:
+                player = al.Player(val,3-val,'Minimax with A-B Pruning',depth,None,forced_moves=forced)
+                start = time.perf_counter()
+                player.use_player_algorithm(grid)
+                seconds += time.perf_counter() - start
+                nodes += player.nodes
+                scores.append(player.last_score)
+            totals[forced] = (nodes,seconds,scores)
+        results.append({
+            'depth': depth,
+            'nodes_full': totals[False][0],
+            'nodes_forced': totals[True][0],
+            'reduction': totals[False][0] / totals[True][0],
+            'seconds_full': totals[False][1],
+            'seconds_forced': totals[True][1],
+            'scores_match': totals[False][2]==totals[True][2],
+        })
+    return results
+
+if __name__=='__main__':
+    parser = argparse.ArgumentParser(description='Connect 4 benchmarks')
+    parser.add_argument('--output',help='JSON file to write the results to')
+    parser.add_argument('--quick',action='store_true',help='smaller benchmarks, for a fast check')
+    parser.add_argument('--parallel',action='store_true',help='also time the root-parallel search')
+    parser.add_argument('--depth',type=int,default=8,help='depth of the root-parallel search')
+    parser.add_argument('--positions',type=int,default=4,help='positions of the root-parallel search')
+    args = parser.parse_args()
+    results = run_suite(args.quick,args.parallel,args.depth,args.positions)
+    print('Search speed')
+    for result in results['search']:
+        print('{phase} {algorithm} depth {depth}: {nodes_per_second:.0f} nodes/s, {ms_per_move:.1f} ms/move'.format(**result))
+    print('Win checks and evaluation (us per call)')
+    print(', '.join(name+' '+str(round(value,2)) for name,value in results['evaluation'].items() if name.endswith('_us')))
+    print('CNN: {single_ms:.3f} ms single, {batched_us_per_position:.1f} us/position in batches of {batch_size}'.format(**results['cnn']))
+    print('Game throughput')
+    for result in results['games']:
+        print('{match}: {games_per_second:.1f} games/s'.format(**result))
+    print('Alpha-beta move ordering')
+    for result in results['move_ordering']:
+        print('depth {depth}: {nodes_static} nodes static, {nodes_ordered} ordered ({reduction:.1f}x fewer), '
+              '{seconds_static:.2f}s v {seconds_ordered:.2f}s, same scores: {scores_match}'.format(**result))
+    print('Forced-move pruning')
+    for result in results['forced_moves']:
+        print('depth {depth}: {nodes_full} nodes full, {nodes_forced} forced ({reduction:.2f}x fewer), '
+              '{seconds_full:.2f}s v {seconds_forced:.2f}s, same scores: {scores_match}'.format(**result))
+    print('Transposition table: {used_mb:.2f} MB used of {size_mb} MB at {occupancy:.0%} occupancy, '
+          'within size: {within_size}'.format(**results['table_memory']))
+    if args.parallel:
+        print('Root-parallel Minimax, depth',args.depth)
+        for result in results['parallel']:
+            print('{workers} workers: {seconds:.2f}s, speedup {speedup:.2f}x, same moves: {moves_match}'.format(**result))
+    if args.output:
+        with open(args.output,'w') as f:
+            json.dump(results,f,indent=2)
@@ -0,0 +1,630 @@
+# -*- coding: utf-8 -*-
+"""
+Bitboard representation of a Connect 4 position used by the search algorithms.
+
+Each column is stored as 7 bits (6 playable cells plus a sentinel bit on top),
+so bit (x*7 + r) is the cell in column x, r rows up from the bottom. Row r
+corresponds to row 5-r of the 6x7 grid used by SetGame.
+"""
+import random
+
+import numpy as np
+
+ROWS = 6
+COLUMNS = 7
+COLUMN_BITS = ROWS + 1
+COLUMN_ORDER = (3, 2, 4, 1, 5, 0, 6)   #Centre-out, same order as Player.get_possible_columns
+
+def cell_bit(y, x):
+    """
+    Gets the bit that represents a cell of the 6x7 grid.
+
+    Parameters
+    ----------
+    y : int
+        Row of the grid (0 is the top row).
+    x : int
+        Column of the grid.
+
+    Returns
+    -------
+    int
+        Bitmask with only the bit of the cell set.
+    """
+    return 1 << (x*COLUMN_BITS + (ROWS-1-y))
+
+def _window_mask(cells):
+    mask = 0
+    for y,x in cells:
+        mask |= cell_bit(y, x)
+    return mask
+
+def _evaluation_windows():
+    """
+    Builds the windows of 4 scored by the heuristic evaluation.
+
+    Only the windows that Player.__grid_evaluation has always scored are included:
+    the first three windows of every row and every vertical window. Its diagonal
+    windows were built as lists, which never compare element-wise, so they never
+    contributed to the score and are left out to keep move choices identical.
+
+    Returns
+    -------
+    windows : list
+        Bitmasks of the scored windows.
+    """
+    windows = []
+    for y in range(6):
+        for x in range(3):
+            windows.append(_window_mask([(y,x+n) for n in range(4)]))
+    for x in range(7):
+        for y in range(3):
+            windows.append(_window_mask([(y+n,x) for n in range(4)]))
+    return windows
+
+def _winning_lines():
+    """
+    Builds every line of 4 cells that wins the game.
+
+    Returns
+    -------
+    lines : list
+        69 tuples of 4 (row, column) cells: 24 across, 21 vertical and 24 diagonal.
+    """
+    lines = []
+    for y in range(6):
+        for x in range(4):
+            lines.append(tuple((y,x+n) for n in range(4)))
+    for x in range(7):
+        for y in range(3):
+            lines.append(tuple((y+n,x) for n in range(4)))
+    for y in range(3):
+        for x in range(4):
+            lines.append(tuple((y+n,x+n) for n in range(4)))
+            lines.append(tuple((y+n,x+3-n) for n in range(4)))
+    return lines
+
+def _window_score(own,opp):
+    """
+    Scores a window of 4 from the counts of discs of each player in it.
+
+    Parameters
+    ----------
+    own : int
+        Number of discs of the player the score is for.
+    opp : int
+        Number of discs of the opponent.
+
+    Returns
+    -------
+    int
+        +5/+3 for three/two own discs with the rest empty, -4/-2 for the opponent.
+    """
+    if opp==0:
+        if own==3:
+            return 5
+        elif own==2:
+            return 3
+    elif own==0:
+        if opp==3:
+            return -4
+        elif opp==2:
+            return -2
+    return 0
+
+def _zobrist_keys(seed=4801):
+    """
+    Generates the random 64-bit keys used to hash positions incrementally.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the generator, fixed so that hashes are the same in every process.
+
+    Returns
+    -------
+    keys : list
+        One list of keys per player, indexed by bit position.
+    """
+    rng = random.Random(seed)
+    return [[rng.getrandbits(64) for n in range(COLUMNS*COLUMN_BITS)] for player in range(2)]
+
+ZOBRIST_KEYS = _zobrist_keys()
+SIDE_KEY = random.Random(4802).getrandbits(64)  #Mixed in by the search to tell apart who is to move
+WINNING_LINES = tuple(_winning_lines())
+WINNING_LINE_MASKS = tuple(_window_mask(line) for line in WINNING_LINES)
+CELL_LINE_MASKS = tuple(tuple(mask for mask in WINNING_LINE_MASKS if mask >> index & 1)
+                        for index in range(COLUMNS*COLUMN_BITS))    #Winning line masks through each bit
+EVALUATION_WINDOWS = tuple(_evaluation_windows())
+CENTRE_MASK = _window_mask([(y,3) for y in range(6)])
+FULL_MASK = _window_mask([(y,x) for y in range(6) for x in range(7)])
+BOTTOM_MASK = _window_mask([(5,x) for x in range(7)])
+CELL_WINDOWS = tuple(tuple(w for w in range(len(EVALUATION_WINDOWS)) if EVALUATION_WINDOWS[w] >> index & 1)
+                     for index in range(COLUMNS*COLUMN_BITS))    #Scored windows through each bit
+#Change to the score of the player adding a disc (OWN_GAIN) and of their opponent (OPP_GAIN)
+#for a window that held own and opp discs before the disc was added
+OWN_GAIN = tuple(tuple(_window_score(own+1,opp)-_window_score(own,opp) for opp in range(4)) for own in range(4))
+OPP_GAIN = tuple(tuple(_window_score(opp,own+1)-_window_score(opp,own) for opp in range(4)) for own in range(4))
+
+def open_cells(board,occupied):
+    """
+    Gets every empty cell that would complete a line of 4 for the discs of a board.
+
+    Parameters
+    ----------
+    board : int
+        Bitmask of one player's discs.
+    occupied : int
+        Bitmask of every disc.
+
+    Returns
+    -------
+    int
+        Bitmask of the cells.
+    """
+    cells = (board << 1) & (board << 2) & (board << 3)  #Vertical: only the cell above can complete it
+    for shift in (COLUMN_BITS, COLUMN_BITS-1, COLUMN_BITS+1):   #Horizontal and both diagonals
+        pair = (board << shift) & (board << 2*shift)
+        cells |= pair & (board << 3*shift)
+        cells |= pair & (board >> shift)
+        pair = (board >> shift) & (board >> 2*shift)
+        cells |= pair & (board << shift)
+        cells |= pair & (board >> 3*shift)
+    return cells & (FULL_MASK ^ occupied)
+
+def completes_line(board,index):
+    """
+    Checks whether the disc at a bit is part of a line of 4. Only the lines through
+    that bit are looked at, so this is the check to make after a move, both in the
+    search and in the game loop.
+
+    Parameters
+    ----------
+    board : int
+        Bitmask of the discs of the player who played the disc.
+    index : int
+        Bit of the disc.
+
+    Returns
+    -------
+    bool
+        True if the disc completes a line of 4.
+    """
+    for mask in CELL_LINE_MASKS[index]:
+        if board & mask == mask:
+            return True
+    return False
+
+def pack_key(mover,mask):
+    """
+    Packs a position into one integer: the discs of one player plus every disc plus
+    the bottom row, which leaves the highest set bit of each column just above its
+    top disc. Used as the key of a Board and of the opening book.
+
+    Parameters
+    ----------
+    mover : int
+        Bitmask of the discs of the player the key is from the point of view of.
+    mask : int
+        Bitmask of every disc.
+
+    Returns
+    -------
+    int
+        Key below 2**49, unique for every position and player.
+    """
+    return mover + mask + BOTTOM_MASK
+
+def unpack_key(key):
+    """
+    Unpacks a key packed with pack_key.
+
+    Parameters
+    ----------
+    key : int
+        Packed position.
+
+    Returns
+    -------
+    mover : int
+        Bitmask of the discs of the player the key is from the point of view of.
+    mask : int
+        Bitmask of every disc.
+    """
+    key = int(key)
+    mask = 0
+    for x in range(COLUMNS):
+        height = ((key >> x*COLUMN_BITS) & ((1 << COLUMN_BITS) - 1)).bit_length() - 1  #The highest set bit marks the top of the column
+        mask |= ((1 << height) - 1) << x*COLUMN_BITS
+    return key & mask,mask
+
+def random_games(own,other,rng):
+    """
+    Plays random moves in many positions at once, as arrays of bitboards (one entry
+    per game), until every game has ended. Each round every unfinished game plays a
+    legal column chosen uniformly at random, and wins are found with vectorised line
+    checks.
+
+    Parameters
+    ----------
+    own : numpy array
+        uint64 bitmasks of the discs of the player to move in each position. The
+        positions must not already be won.
+    other : numpy array
+        uint64 bitmasks of the discs of their opponent.
+    rng : numpy Generator
+        Source of the random moves.
+
+    Returns
+    -------
+    winner : numpy array
+        0 where the player to move won, 1 where their opponent won and -1 for a draw.
+    length : numpy array
+        Moves played in each game.
+    """
+    num_games = len(own)
+    boards = np.stack([own,other],axis=1).astype(np.uint64)
+    mask = boards[:,0] | boards[:,1]
+    heights = np.empty((num_games,COLUMNS),dtype=np.int64)   #Bit of the next cell of each column
+    for x in range(COLUMNS):
+        column = mask >> np.uint64(x*COLUMN_BITS)
+        count = np.zeros(num_games,dtype=np.int64)
+        for r in range(ROWS):
+            count += ((column >> np.uint64(r)) & np.uint64(1)).astype(np.int64)
+        heights[:,x] = x*COLUMN_BITS + count
+    tops = np.arange(COLUMNS)*COLUMN_BITS + ROWS
+    winner = np.full(num_games,-1,dtype=np.int64)
+    length = np.zeros(num_games,dtype=np.int64)
+    active = np.arange(num_games)
+    for ply in range(ROWS*COLUMNS):
+        legal = heights[active] < tops
+        playable = legal.any(axis=1)
+        if not playable.all():  #Full boards are drawn
+            active = active[playable]
+            legal = legal[playable]
+            if not len(active):
+                break
+        player = ply % 2
+        columns = np.argmax(np.where(legal,rng.random(legal.shape),-1.0),axis=1)
+        cells = heights[active,columns]
+        heights[active,columns] = cells + 1
+        moved = boards[active,player] | (np.uint64(1) << cells.astype(np.uint64))
+        boards[active,player] = moved
+        won = np.zeros(len(active),dtype=bool)
+        for shift in (1,7,6,8):     #Vertical, horizontal and both diagonals
+            pairs = moved & (moved >> np.uint64(shift))
+            won |= (pairs & (pairs >> np.uint64(2*shift)))!=0
+        length[active] = ply + 1
+        winner[active[won]] = player
+        active = active[~won]
+        if not len(active):
+            break
+    return winner,length
+
+class Bitboard:
+    def __init__(self,track_evaluation=False):
+        self.boards = [0, 0]    #Discs of player 1 and player 2
+        self.heights = [x*COLUMN_BITS for x in range(COLUMNS)]    #Next free bit of each column
+        self.moves = []
+        self.counter = 0
+        self.hash = 0   #Zobrist hash of the discs, updated by play and undo
+        if track_evaluation:    #Disc counts of every scored window, kept up to date by play and undo
+            self.window_counts = [[0]*len(EVALUATION_WINDOWS), [0]*len(EVALUATION_WINDOWS)]
+            self.scores = [0, 0]    #Heuristic score from the point of view of player 1 and player 2
+        else:
+            self.window_counts = None
+
+    @classmethod
+    def from_grid(cls,grid,track_evaluation=False):
+        """
+        Creates a bitboard from the grid used by SetGame.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of the game.
+        track_evaluation : bool, optional
+            Keep the heuristic evaluation up to date as moves are played.
+
+        Returns
+        -------
+        board : Bitboard
+            Bitboard holding the same discs as the grid.
+        """
+        board = cls(track_evaluation)
+        for x in range(COLUMNS):
+            for y in range(ROWS-1,-1,-1):
+                value = grid[y][x]
+                if value==0:
+                    break
+                board._place(x,int(value)-1)
+        return board
+
+    @classmethod
+    def from_boards(cls,boards,track_evaluation=False):
+        """
+        Creates a bitboard from the discs of each player, laid out as in this module,
+        e.g. those kept by connect4_board.Board.
+
+        Parameters
+        ----------
+        boards : list
+            Bitmasks of the discs of player 1 and player 2.
+        track_evaluation : bool, optional
+            Keep the heuristic evaluation up to date as moves are played.
+
+        Returns
+        -------
+        board : Bitboard
+            Bitboard holding the same discs.
+        """
+        board = cls(track_evaluation)
+        for x in range(COLUMNS):
+            for index in range(x*COLUMN_BITS,x*COLUMN_BITS+ROWS):
+                if boards[0] >> index & 1:
+                    board._place(x,0)
+                elif boards[1] >> index & 1:
+                    board._place(x,1)
+                else:
+                    break
+        return board
+
+    def _place(self,x,player):
+        """
+        Sets the next free bit of a column for a player (0 or 1), updating the hash
+        and, if tracked, the windows of 4 that pass through it.
+        """
+        index = self.heights[x]
+        self.boards[player] |= 1 << index
+        self.hash ^= ZOBRIST_KEYS[player][index]
+        self.heights[x] = index + 1
+        self.counter += 1
+        if self.window_counts is not None:
+            own = self.window_counts[player]
+            opp = self.window_counts[1-player]
+            own_score = other_score = 0
+            for w in CELL_WINDOWS[index]:
+                a = own[w]
+                b = opp[w]
+                own_score += OWN_GAIN[a][b]
+                other_score += OPP_GAIN[a][b]
+                own[w] = a + 1
+            if x==3:
+                own_score += 2
+            self.scores[player] += own_score
+            self.scores[1-player] += other_score
+
+    def to_grid(self):
+        """
+        Converts the bitboard back into the grid used by SetGame.
+
+        Returns
+        -------
+        grid : numpy array
+            6x7 grid with 0 for empty cells and the player values elsewhere.
+        """
+        grid = np.zeros((6,7))
+        for y in range(ROWS):
+            for x in range(COLUMNS):
+                bit = cell_bit(y, x)
+                if self.boards[0] & bit:
+                    grid[y][x] = 1
+                elif self.boards[1] & bit:
+                    grid[y][x] = 2
+        return grid
+
+    def can_play(self,x):
+        """
+        Checks whether a column still has space for a disc.
+
+        Parameters
+        ----------
+        x : int
+            Column to check.
+
+        Returns
+        -------
+        bool
+            True if the column is not full.
+        """
+        return self.heights[x] < x*COLUMN_BITS + ROWS
+
+    def get_possible_columns(self):
+        """
+        Gets the playable columns in the centre-out order used by the search.
+
+        Returns
+        -------
+        list
+            Columns that can legally be played to.
+        """
+        heights = self.heights
+        return [x for x in COLUMN_ORDER if heights[x] < x*COLUMN_BITS + ROWS]
+
+    def get_row(self,x):
+        """
+        Gets the grid row the next disc played in a column lands on.
+
+        Parameters
+        ----------
+        x : int
+            Column being looked at.
+
+        Returns
+        -------
+        int
+            Row of the grid (0 is the top row).
+        """
+        return ROWS - 1 - (self.heights[x] - x*COLUMN_BITS)
+
+    def play(self,x,val):
+        """
+        Drops a disc into a column.
+
+        Parameters
+        ----------
+        x : int
+            Column to play to. Must be playable.
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        None.
+        """
+        self._place(x,val-1)
+        self.moves.append(x)
+
+    def undo(self):
+        """
+        Takes back the last disc played.
+
+        Returns
+        -------
+        None.
+        """
+        x = self.moves.pop()
+        self.heights[x] -= 1
+        index = self.heights[x]
+        player = 0 if self.boards[0] >> index & 1 else 1
+        self.boards[player] &= ~(1 << index)
+        self.hash ^= ZOBRIST_KEYS[player][index]
+        self.counter -= 1
+        if self.window_counts is not None:
+            own = self.window_counts[player]
+            opp = self.window_counts[1-player]
+            own_score = other_score = 0
+            for w in CELL_WINDOWS[index]:
+                a = own[w] - 1
+                b = opp[w]
+                own_score += OWN_GAIN[a][b]
+                other_score += OPP_GAIN[a][b]
+                own[w] = a
+            if x==3:
+                own_score += 2
+            self.scores[player] -= own_score
+            self.scores[1-player] -= other_score
+
+    def has_won(self,val):
+        """
+        Checks whether a player has four in a row.
+
+        Parameters
+        ----------
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        bool
+            True if the player has a winning line.
+        """
+        board = self.boards[val-1]
+        for shift in (1, COLUMN_BITS, COLUMN_BITS-1, COLUMN_BITS+1): #Vertical, horizontal and both diagonals
+            pairs = board & (board >> shift)
+            if pairs & (pairs >> 2*shift):
+                return True
+        return False
+
+    def is_winning_move(self,x,val):
+        """
+        Checks whether playing a column would complete a line of 4, looking only at
+        the lines through the cell the disc would land on.
+
+        Parameters
+        ----------
+        x : int
+            Column to play to. Must be playable.
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        bool
+            True if the move wins the game.
+        """
+        index = self.heights[x]
+        return completes_line(self.boards[val-1] | 1 << index,index)
+
+    def last_move_won(self):
+        """
+        Checks whether the last disc played completed a line of 4, looking only at
+        the lines through its cell. Only the player who moved last can have just won,
+        so this is the check the search makes at every node.
+
+        Returns
+        -------
+        bool
+            True if the last move won the game, False if it did not or no move has
+            been played on the bitboard.
+        """
+        if not self.moves:
+            return False
+        index = self.heights[self.moves[-1]] - 1
+        return completes_line(self.boards[0] if self.boards[0] >> index & 1 else self.boards[1],index)
+
+    def winning_cells(self,val):
+        """
+        Gets every empty cell that would complete a line of 4 for a player, whether
+        or not it can be played yet.
+
+        Parameters
+        ----------
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        int
+            Bitmask of the cells.
+        """
+        return open_cells(self.boards[val-1],self.boards[0] | self.boards[1])
+
+    def playable_cells(self):
+        """
+        Gets the cells the next disc of each column would land on.
+
+        Returns
+        -------
+        int
+            Bitmask of the cells, with nothing for full columns.
+        """
+        return ((self.boards[0] | self.boards[1]) + BOTTOM_MASK) & FULL_MASK
+
+    def is_full(self):
+        """
+        Checks whether every cell has been played (resulting in a draw).
+
+        Returns
+        -------
+        bool
+            True if the board is full.
+        """
+        return self.counter == ROWS*COLUMNS
+
+    def evaluate(self,player,opponent):
+        """
+        Heuristic evaluation of the position, matching Player.__grid_evaluation.
+        Boards that track the evaluation answer straight from the running score,
+        others score every window.
+
+        Parameters
+        ----------
+        player : int
+            Value of the player the score is for.
+        opponent : int
+            Value of the opponent.
+
+        Returns
+        -------
+        score : int
+            The overall score associated to the position.
+        """
+        if self.window_counts is not None:
+            return self.scores[player-1]
+        own = self.boards[player-1]
+        opp = self.boards[opponent-1]
+        score = (own & CENTRE_MASK).bit_count() * 2
+        for window in EVALUATION_WINDOWS:
+            score += _window_score((own & window).bit_count(), (opp & window).bit_count())
+        return score
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Board used by SetGame and the GUI to hold the game being played. The discs are
+kept both as a 6x7 int8 grid (cells), which the win checks and the drawing read
+without copying, and as a pair of bitboards, from which the players build their
+search bitboards without reading the grid and a position packs into a single
+49-bit key (bb.pack_key, as the opening book uses) for storing and hashing.
+Players take a Board wherever they take a grid.
+"""
+import numpy as np
+
+import connect4_bitboard as bb
+
+class Board:
+    __slots__ = ('cells','boards','heights','moves')
+
+    def __init__(self):
+        self.cells = np.zeros((bb.ROWS,bb.COLUMNS),dtype=np.int8)     #Row 0 is the top, as in the grid
+        self.boards = [0, 0]    #Bitboards of player 1 and player 2
+        self.heights = [0]*bb.COLUMNS   #Discs in each column
+        self.moves = []
+
+    @classmethod
+    def from_key(cls,key,val=1):
+        """
+        Unpacks a position packed with key.
+
+        Parameters
+        ----------
+        key : int
+            Packed position.
+        val : int, optional
+            Value of the player the key was packed for (1 or 2).
+
+        Returns
+        -------
+        board : Board
+            Board holding the position. The order the discs were played in is not
+            kept, so its moves cannot be undone.
+        """
+        board = cls()
+        mover,mask = bb.unpack_key(key)
+        for x in range(bb.COLUMNS):
+            for r in range(bb.ROWS):
+                bit = 1 << (x*bb.COLUMN_BITS + r)
+                if not mask & bit:
+                    break
+                board.play(x,val if mover & bit else 3-val)
+        board.moves = []
+        return board
+
+    def copy(self):
+        """
+        Copies the board, e.g. for a search running in another thread.
+
+        Returns
+        -------
+        board : Board
+            Board holding the same discs, unaffected by later moves on this one.
+        """
+        board = Board()
+        board.cells[:] = self.cells
+        board.boards = list(self.boards)
+        board.heights = list(self.heights)
+        board.moves = list(self.moves)
+        return board
+
+    def play(self,x,val):
+        """
+        Drops a disc into a column.
+
+        Parameters
+        ----------
+        x : int
+            Column to play to. Must be playable.
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        int
+            Row of the grid the disc landed on (0 is the top row).
+        """
+        val = int(val)
+        r = self.heights[x]
+        self.cells[bb.ROWS-1-r,x] = val
+        self.boards[val-1] |= 1 << (x*bb.COLUMN_BITS + r)
+        self.heights[x] = r + 1
+        self.moves.append(x)
+        return bb.ROWS-1-r
+
+    def undo(self):
+        """
+        Takes back the last disc played.
+
+        Returns
+        -------
+        x : int
+            Column the disc was taken from.
+        """
+        x = self.moves.pop()
+        r = self.heights[x] - 1
+        val = int(self.cells[bb.ROWS-1-r,x])
+        self.cells[bb.ROWS-1-r,x] = 0
+        self.boards[val-1] &= ~(1 << (x*bb.COLUMN_BITS + r))
+        self.heights[x] = r
+        return x
+
+    def can_play(self,x):
+        """
+        Checks whether a column still has space for a disc.
+
+        Parameters
+        ----------
+        x : int
+            Column to check.
+
+        Returns
+        -------
+        bool
+            True if the column is not full.
+        """
+        return self.heights[x]<bb.ROWS
+
+    def has_won(self,val):
+        """
+        Checks whether a player has four in a row.
+
+        Parameters
+        ----------
+        val : int
+            Value of the player (1 or 2).
+
+        Returns
+        -------
+        bool
+            True if the player has a winning line.
+        """
+        board = self.boards[int(val)-1]
+        for shift in (1, bb.COLUMN_BITS, bb.COLUMN_BITS-1, bb.COLUMN_BITS+1):
+            pairs = board & (board >> shift)
+            if pairs & (pairs >> 2*shift):
+                return True
+        return False
+
+    def is_full(self):
+        """
+        Checks whether every cell has been played (resulting in a draw).
+
+        Returns
+        -------
+        bool
+            True if the board is full.
+        """
+        return min(self.heights)==bb.ROWS
+
+    def key(self,val=1):
+        """
+        Packs the position into one integer with bb.pack_key.
+
+        Parameters
+        ----------
+        val : int, optional
+            Value of the player to pack the position for (1 or 2). Packed for the
+            player to move, it is the key the opening book stores the position under
+            (before mirroring).
+
+        Returns
+        -------
+        int
+            Key below 2**49, unique for every position.
+        """
+        return bb.pack_key(self.boards[int(val)-1],self.boards[0] | self.boards[1])
+
+    def to_bitboard(self,track_evaluation=False):
+        """
+        Creates a search bitboard of the position from the board's bitboards.
+
+        Parameters
+        ----------
+        track_evaluation : bool, optional
+            Keep the heuristic evaluation up to date as moves are played.
+
+        Returns
+        -------
+        Bitboard
+            Bitboard holding the same discs.
+        """
+        return bb.Bitboard.from_boards(self.boards,track_evaluation)
+
+    def as_tensor(self):
+        """
+        Gets a torch view of the grid, sharing its memory.
+
+        Returns
+        -------
+        torch tensor
+            6x7 int8 tensor, changed by the moves played on the board.
+        """
+        import torch    #Imported here so the board itself does not need torch
+        return torch.from_numpy(self.cells)
+
+    def __getitem__(self,y):
+        return self.cells[y]    #Row of the grid, so the board reads as board[y][x]
+
+    def __array__(self,dtype=None,copy=None):
+        if copy is False:   #Only a view of the grid itself, which cells also gives
+            if dtype is not None and np.dtype(dtype)!=self.cells.dtype:
+                raise ValueError('The grid is int8, so cannot be viewed as '+str(np.dtype(dtype)))
+            return self.cells
+        return self.cells.copy() if dtype is None else self.cells.astype(dtype)
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __eq__(self,other):
+        return isinstance(other,Board) and self.boards==other.boards
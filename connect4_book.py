@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Opening book: the best move of every position in the first plies of a game,
+found once by a deep alpha-beta search and looked up during play.
+
+Positions are keyed from the point of view of the player to move, so the same
+book serves both colours, and a position and its mirror image share one entry.
+The book is saved as a .npz file of sorted uint64 keys and uint8 columns.
+
+The grid evaluation is not left-right symmetric, so for a mirrored position the
+book can give a column the search itself would score slightly differently.
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import connect4_bitboard as bb
+
+DEFAULT_PLIES = 4
+DEFAULT_DEPTH = 9
+COLUMN_MASK = (1 << bb.COLUMN_BITS) - 1
+
+def mirror(bits):
+    """
+    Mirrors a bitboard left to right.
+
+    Parameters
+    ----------
+    bits : int
+        Bitmask in the Bitboard layout.
+
+    Returns
+    -------
+    int
+        The bitmask with column x moved to column 6-x.
+    """
+    mirrored = 0
+    for x in range(bb.COLUMNS):
+        mirrored |= ((bits >> x*bb.COLUMN_BITS) & COLUMN_MASK) << (bb.COLUMNS-1-x)*bb.COLUMN_BITS
+    return mirrored
+
+def position_key(board,val):
+    """
+    Gets the book key of a position, packed with bb.pack_key from the point of view
+    of the player to move, so it is the Board key of that player.
+
+    Parameters
+    ----------
+    board : Bitboard
+        Current state of the game.
+    val : int
+        Value of the player to move.
+
+    Returns
+    -------
+    key : int
+        Key of the position or its mirror image, whichever is smaller.
+    is_mirrored : bool
+        True if the key is of the mirror image.
+    """
+    mover = board.boards[val-1]
+    mask = board.boards[0] | board.boards[1]
+    key = bb.pack_key(mover,mask)
+    mirrored_key = bb.pack_key(mirror(mover),mirror(mask))
+    if mirrored_key<key:
+        return mirrored_key,True
+    return key,False
+
+class OpeningBook:
+    def __init__(self,keys=None,columns=None,plies=0,depth=0):
+        if keys is None:
+            keys = np.zeros(0,dtype=np.uint64)
+            columns = np.zeros(0,dtype=np.uint8)
+        self.keys = keys
+        self.columns = columns
+        self.plies = plies
+        self.depth = depth
+        self.moves = dict(zip(keys.tolist(),columns.tolist()))
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def load(cls,path):
+        """
+        Loads a book saved with save.
+
+        Parameters
+        ----------
+        path : str
+            File of the book.
+
+        Returns
+        -------
+        OpeningBook
+            The loaded book.
+        """
+        with np.load(path) as data:
+            return cls(data['keys'],data['columns'],int(data['plies']),int(data['depth']))
+
+    def save(self,path):
+        """
+        Saves the book as sorted keys and their columns.
+
+        Parameters
+        ----------
+        path : str
+            File to save to.
+
+        Returns
+        -------
+        None.
+        """
+        order = np.argsort(self.keys)
+        np.savez(path,keys=self.keys[order],columns=self.columns[order],plies=self.plies,depth=self.depth)
+
+    def lookup(self,board,val):
+        """
+        Gets the book move of a position.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        val : int
+            Value of the player to move.
+
+        Returns
+        -------
+        int or None
+            The column to play, or None if the position is not in the book.
+        """
+        self.lookups += 1
+        if board.counter>self.plies:
+            return None
+        key,is_mirrored = position_key(board,val)
+        x = self.moves.get(key)
+        if x is None:
+            return None
+        self.hits += 1
+        return bb.COLUMNS-1-x if is_mirrored else x
+
+    def get_stats(self):
+        """
+        Gets the size and hit rate of the book.
+
+        Returns
+        -------
+        dict
+            Positions stored, plies and depth it was built with, bytes on disk
+            (keys and columns), lookups, hits and hit rate.
+        """
+        return {
+            'positions': len(self.moves),
+            'plies': self.plies,
+            'depth': self.depth,
+            'bytes': int(self.keys.nbytes + self.columns.nbytes),
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+        }
+
+def book_positions(plies):
+    """
+    Lists every position that can be reached in the first plies of a game, with
+    mirror images counted once and won positions left out.
+
+    Parameters
+    ----------
+    plies : int
+        Most discs a position can have.
+
+    Returns
+    -------
+    positions : list
+        (key, moves played from the empty board) of each position, with the
+        moves mirrored where needed so they lead to the position of the key.
+    """
+    positions = []
+    seen = set()
+    frontier = [[]]
+    for ply in range(plies+1):
+        following = []
+        for moves in frontier:
+            board = bb.Bitboard()
+            for n,x in enumerate(moves):
+                board.play(x,1 + n%2)
+            val = 1 + ply%2
+            key,is_mirrored = position_key(board,val)
+            if key in seen:
+                continue
+            seen.add(key)
+            positions.append((key,[bb.COLUMNS-1-x for x in moves] if is_mirrored else moves))
+            for x in board.get_possible_columns():
+                if not board.is_winning_move(x,val):
+                    following.append(moves+[x])
+        frontier = following
+    return positions
+
+def _search_position(args):
+    """
+    Finds the book move of one position in a worker process.
+
+    Parameters
+    ----------
+    args : tuple
+        Moves played from the empty board and the search depth.
+
+    Returns
+    -------
+    int
+        Column the search chooses.
+    """
+    import connect4_algorithms as al
+    moves,depth = args
+    board = bb.Bitboard()
+    for n,x in enumerate(moves):
+        board.play(x,1 + n%2)
+    val = 1 + len(moves)%2
+    player = al.Player(val,3-val,'Minimax with A-B Pruning',depth,None)
+    y,x = player.use_player_algorithm(board.to_grid())
+    return x
+
+def build_book(plies=DEFAULT_PLIES,depth=DEFAULT_DEPTH,workers=1,progress=None):
+    """
+    Builds a book by searching every position of the first plies of a game.
+
+    Parameters
+    ----------
+    plies : int, optional
+        Most discs a position in the book can have.
+    depth : int, optional
+        Depth of the alpha-beta search used to choose each move.
+    workers : int, optional
+        Number of worker processes.
+    progress : function, optional
+        Called with the number of positions searched and the total.
+
+    Returns
+    -------
+    book : OpeningBook
+        The built book.
+    seconds : float
+        Time taken to build it.
+    """
+    start = time.perf_counter()
+    positions = book_positions(plies)
+    tasks = [(moves,depth) for key,moves in positions]
+    columns = []
+    if workers>1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for x in pool.map(_search_position,tasks,chunksize=8):
+                columns.append(x)
+                if progress is not None:
+                    progress(len(columns),len(tasks))
+    else:
+        for task in tasks:
+            columns.append(_search_position(task))
+            if progress is not None:
+                progress(len(columns),len(tasks))
+    keys = np.array([key for key,moves in positions],dtype=np.uint64)
+    book = OpeningBook(keys,np.array(columns,dtype=np.uint8),plies,depth)
+    return book,time.perf_counter()-start
+
+def measure_hit_rate(book,num_games=20,depth=4,seed=4801):
+    """
+    Measures how often the book answers a move in real games, by playing a
+    'Minimax with A-B Pruning' player using the book against random moves,
+    alternating who starts.
+
+    Parameters
+    ----------
+    book : OpeningBook
+        Book to measure. Its counters are reset first.
+    num_games : int, optional
+        Number of games to play.
+    depth : int, optional
+        Search depth of the player when the book has no move.
+    seed : int, optional
+        Seed of the random moves.
+
+    Returns
+    -------
+    dict
+        The book statistics after the games, see OpeningBook.get_stats.
+    """
+    import connect4_algorithms as al
+    rng = random.Random(seed)
+    book.lookups = 0
+    book.hits = 0
+    for game in range(num_games):
+        val = 1 + game%2
+        player = al.Player(val,3-val,'Minimax with A-B Pruning',depth,None,book=book)
+        board = bb.Bitboard()
+        turn = 1
+        while not board.is_full():
+            if turn==val:
+                y,x = player.use_player_algorithm(board.to_grid())
+            else:
+                x = rng.choice(board.get_possible_columns())
+            if board.is_winning_move(x,turn):
+                break
+            board.play(x,turn)
+            turn = 3 - turn
+    return book.get_stats()
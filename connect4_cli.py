@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+"""
+Command-line entry point for running Connect 4 without the GUI (and without tkinter).
+
+Example:
+    python -m connect4_cli tournament --player random --player alphabeta:6 --games 100 --output results.json
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+
+import connect4_algorithms as al
+import connect4_book as opening
+import connect4_dataset as dataset
+import connect4_mcts as mcts
+import connect4_selfplay as selfplay
+import connect4_simulation as sim
+import connect4_solver as solver
+import neural_net_trainer as neural_net
+
+ALIASES = {
+    'random': 'Random',
+    'minimax': 'Minimax',
+    'alphabeta': 'Minimax with A-B Pruning',
+    'pvs': 'Principal Variation Search',
+    'cnn': 'Artificial Neural Network',
+    'solver': 'Solver',
+    'mcts': 'MCTS',
+}
+DEFAULT_DEPTH = 4
+
+def parse_player(text):
+    """
+    Reads a player given as ALGORITHM[:DEPTH], e.g. 'alphabeta:6' or 'Minimax:4'.
+
+    Parameters
+    ----------
+    text : str
+        Player given on the command line.
+
+    Returns
+    -------
+    config : dict
+        Algorithm and depth of the player.
+    """
+    name,sep,depth = text.rpartition(':')
+    if not sep or not depth.isdigit():
+        name,depth = text,str(DEFAULT_DEPTH)
+    algorithm = ALIASES.get(name.lower(),name)
+    if algorithm not in al.ALGORITHMS:
+        raise argparse.ArgumentTypeError('unknown algorithm '+repr(name)+', choose from '+
+                                         ', '.join(list(ALIASES)+al.ALGORITHMS))
+    return {'algorithm': algorithm,'depth': int(depth)}
+
+def player_label(config):
+    """
+    Gets the name a player is reported under.
+
+    Parameters
+    ----------
+    config : dict
+        Settings of the player.
+
+    Returns
+    -------
+    str
+        Algorithm and, for search algorithms, depth.
+    """
+    if config['algorithm'] in al.BOOK_ALGORITHMS:
+        return config['algorithm']+' (depth '+str(config['depth'])+')'
+    return config['algorithm']
+
+def run_tournament(entrants,num_games,workers=1,progress=None):
+    """
+    Plays every pair of entrants against each other, num_games games per pair, with
+    the first player alternating between games.
+
+    Parameters
+    ----------
+    entrants : list
+        Settings of each entrant, see connect4_simulation.make_players.
+    num_games : int
+        Number of games per pair.
+    workers : int, optional
+        Number of worker processes.
+    progress : function, optional
+        Called with the label of the match and the results so far.
+
+    Returns
+    -------
+    matches : list
+        One dict per pair with the results of its games.
+    """
+    matches = []
+    for first,second in itertools.combinations(range(len(entrants)),2):
+        configs = [entrants[first],entrants[second]]
+        label = player_label(configs[0])+' v '+player_label(configs[1])
+        callback = None if progress is None else lambda results: progress(label,results)
+        results = sim.run_batch(configs,num_games,workers=workers,progress=callback)
+        matches.append({
+            'player1': player_label(configs[0]),
+            'player2': player_label(configs[1]),
+            'games': results['games'],
+            'player1_wins': results['wins'][0],
+            'player2_wins': results['wins'][1],
+            'draws': results['draws'],
+            'player1_moves': results['moves'][0],
+            'player2_moves': results['moves'][1],
+            'player1_ms_per_move': 1000*results['move_time'][0]/max(1,results['moves'][0]),
+            'player2_ms_per_move': 1000*results['move_time'][1]/max(1,results['moves'][1]),
+            'player1_ponder_hit_rate': results['ponder_hits'][0]/results['ponders'][0] if results['ponders'][0] else None,
+            'player2_ponder_hit_rate': results['ponder_hits'][1]/results['ponders'][1] if results['ponders'][1] else None,
+            'player1_ms_saved_per_move': 1000*results['saved_time'][0]/max(1,results['moves'][0]),
+            'player2_ms_saved_per_move': 1000*results['saved_time'][1]/max(1,results['moves'][1]),
+            'player1_solver_fallbacks': results['fallbacks'][0],
+            'player2_solver_fallbacks': results['fallbacks'][1],
+            'seconds': results['seconds'],
+            'games_per_second': results['games']/results['seconds'] if results['seconds'] else 0.0,
+        })
+    return matches
+
+def write_results(matches,path):
+    """
+    Writes the tournament results as CSV if the path ends in .csv, otherwise as JSON.
+
+    Parameters
+    ----------
+    matches : list
+        Results of each pair, see run_tournament.
+    path : str
+        File to write to.
+
+    Returns
+    -------
+    None.
+    """
+    if path.lower().endswith('.csv'):
+        with open(path,'w',newline='') as f:
+            writer = csv.DictWriter(f,fieldnames=list(matches[0]))
+            writer.writeheader()
+            writer.writerows(matches)
+    else:
+        with open(path,'w') as f:
+            json.dump({'matches': matches},f,indent=2)
+
+def tournament(args):
+    """
+    Runs the tournament command: plays the entrants, prints a summary and writes the results.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    entrants = args.player
+    if len(entrants)<2:
+        sys.exit('A tournament needs at least two --player entries')
+    if args.time_ms is not None:
+        for config in entrants:
+            config['time_limit_ms'] = args.time_ms
+    for config in entrants:
+        if config['algorithm']=='Artificial Neural Network':
+            config['checkpoint'] = args.checkpoint
+        if args.book and config['algorithm'] in al.BOOK_ALGORITHMS:
+            config['book'] = args.book
+        if args.endgame_table and config['algorithm']=='Solver':
+            config['endgame_table'] = args.endgame_table
+        if args.ponder and config['algorithm'] in al.BOOK_ALGORITHMS:
+            config['pondering'] = True
+        if config['algorithm']=='MCTS':
+            config['playouts'] = args.playouts
+            config['mcts_prior'] = args.mcts_prior
+            config['checkpoint'] = args.checkpoint
+    progress = None
+    if not args.quiet:
+        progress = lambda label,results: print('\r'+label+': '+str(results['games'])+'/'+str(args.games),
+                                               end='\n' if results['games']==args.games else '',
+                                               file=sys.stderr,flush=True)
+    matches = run_tournament(entrants,args.games,args.workers,progress)
+    for match in matches:
+        print(match['player1']+' v '+match['player2']+': '+str(match['player1_wins'])+'-'+
+              str(match['player2_wins'])+' ('+str(match['draws'])+' drawn) in '+
+              str(round(match['seconds'],2))+' seconds')
+        for n in ('1','2'):
+            if match['player'+n+'_ponder_hit_rate'] is not None:
+                print('  '+match['player'+n]+' predicted '+str(round(100*match['player'+n+'_ponder_hit_rate'],1))+
+                      '% of replies, saving '+str(round(match['player'+n+'_ms_saved_per_move'],1))+' ms per move')
+            if match['player'+n+'_solver_fallbacks']:
+                print('  '+match['player'+n]+' could not solve '+str(match['player'+n+'_solver_fallbacks'])+' of '+
+                      str(match['player'+n+'_moves'])+' moves in time and searched them with alpha-beta')
+    if args.output:
+        write_results(matches,args.output)
+
+def convert_data(args):
+    """
+    Runs the convert-data command: converts per-game pickle files into a sharded dataset.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    count = dataset.convert_pickles(args.source,args.output,args.shard_size)
+    print('Converted '+str(count)+' positions from '+args.source+' into '+args.output)
+
+def train(args):
+    """
+    Runs the train command: trains a CNN on a sharded dataset and saves its checkpoint.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    neural_net.train_and_test(args.train_data,args.test_data,args.checkpoint,num_epochs=args.epochs,
+                              batch_size=args.batch_size,learning_rate=args.learning_rate,
+                              optimiser_name=args.optimiser,momentum=args.momentum,lr_decay=args.lr_decay,
+                              workers=args.workers,seed=args.seed)
+
+def self_play(args):
+    """
+    Runs the selfplay command: generates labelled positions into a sharded dataset,
+    resuming if the output folder already holds part of the generation.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    progress = None
+    if not args.quiet:
+        progress = lambda count: print('\r'+str(count)+'/'+str(args.positions)+' positions',end='',
+                                       file=sys.stderr,flush=True)
+    count = selfplay.generate(args.output,args.positions,depth=args.depth,workers=args.workers,seed=args.seed,
+                              scores=args.scores,opening_plies=args.opening_plies,random_rate=args.random_rate,
+                              shard_size=args.shard_size,progress=progress)
+    if progress is not None:
+        print(file=sys.stderr)
+    print(str(count)+' unique positions in '+args.output)
+
+def build_book(args):
+    """
+    Runs the book command: searches every position of the first plies, saves the
+    opening book and reports its size, build time and hit rate in play.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    progress = None
+    if not args.quiet:
+        progress = lambda done,total: print('\r'+str(done)+'/'+str(total)+' positions',end='',
+                                            file=sys.stderr,flush=True)
+    book,seconds = opening.build_book(args.plies,args.depth,args.workers,progress)
+    if progress is not None:
+        print(file=sys.stderr)
+    book.save(args.output)
+    stats = opening.measure_hit_rate(book,args.test_games)
+    print('Book of '+str(stats['positions'])+' positions up to ply '+str(stats['plies'])+' (depth '+
+          str(stats['depth'])+') built in '+str(round(seconds,2))+' seconds, '+
+          str(os.path.getsize(args.output))+' bytes in '+args.output)
+    print('Hit rate over '+str(args.test_games)+' games against random moves: '+str(stats['hits'])+'/'+
+          str(stats['lookups'])+' moves ('+str(round(100*stats['hit_rate'],1))+'%)')
+
+def build_endgame_table(args):
+    """
+    Runs the endgame command: solves every position with a given number of empty
+    cells that can follow a set of random open positions and saves them as an endgame table.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Command-line arguments.
+
+    Returns
+    -------
+    None.
+    """
+    discs = solver.CELLS - args.empty_cells - args.plies
+    positions = solver.quiet_positions(args.positions,discs,args.seed)
+    progress = None
+    if not args.quiet:
+        progress = lambda count: print('\r'+str(count)+' positions solved',end='',file=sys.stderr,flush=True)
+    start = time.perf_counter()
+    table = solver.build_endgame_table(positions,args.empty_cells,progress=progress)
+    seconds = time.perf_counter() - start
+    if progress is not None:
+        print(file=sys.stderr)
+    table.save(args.output)
+    print('Endgame table of '+str(len(table.positions))+' positions with '+str(args.empty_cells)+
+          ' empty cells built in '+str(round(seconds,2))+' seconds, '+str(os.path.getsize(args.output))+
+          ' bytes in '+args.output)
+
+def main(argv=None):
+    """
+    Parses the command line and runs the chosen command.
+
+    Parameters
+    ----------
+    argv : list, optional
+        Arguments to parse instead of sys.argv.
+
+    Returns
+    -------
+    None.
+    """
+    parser = argparse.ArgumentParser(prog='connect4_cli',description='Headless Connect 4')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    parser_tournament = commands.add_parser('tournament',help='play algorithms against each other')
+    parser_tournament.add_argument('--player',type=parse_player,action='append',default=[],
+                                   help='ALGORITHM[:DEPTH], given once per entrant (default depth '+str(DEFAULT_DEPTH)+')')
+    parser_tournament.add_argument('--games',type=int,default=100,help='games per pair of entrants')
+    parser_tournament.add_argument('--time-ms',type=int,help='per-move time budget for the Minimax players')
+    parser_tournament.add_argument('--checkpoint',default=neural_net.DEFAULT_CHECKPOINT,
+                                   help='model for the neural network players, e.g. '+', '.join(neural_net.CHECKPOINTS))
+    parser_tournament.add_argument('--book',help='opening book for the Minimax players, see the book command')
+    parser_tournament.add_argument('--endgame-table',help='endgame table for the Solver players, see the endgame command')
+    parser_tournament.add_argument('--playouts',type=int,default=mcts.DEFAULT_PLAYOUTS,
+                                   help='playouts per move of the MCTS players without --time-ms')
+    parser_tournament.add_argument('--mcts-prior',action='store_true',help='guide the MCTS players with the CNN of --checkpoint')
+    parser_tournament.add_argument('--ponder',action='store_true',help='let the Minimax players search on their opponent\'s time')
+    parser_tournament.add_argument('--workers',type=int,default=os.cpu_count() or 1)
+    parser_tournament.add_argument('--output',help='results file, .json or .csv')
+    parser_tournament.add_argument('--quiet',action='store_true',help='do not show progress')
+    parser_tournament.set_defaults(func=tournament)
+
+    parser_convert = commands.add_parser('convert-data',help='convert pickled training games into a sharded dataset')
+    parser_convert.add_argument('--source',required=True,help='folder or zip of GameN_Depth_6.pkl files, e.g. train.zip or test')
+    parser_convert.add_argument('--output',required=True,help='folder to write the dataset to')
+    parser_convert.add_argument('--shard-size',type=int,default=dataset.SHARD_SIZE)
+    parser_convert.set_defaults(func=convert_data)
+
+    parser_selfplay = commands.add_parser('selfplay',help='generate labelled positions by Minimax self-play')
+    parser_selfplay.add_argument('--output',required=True,help='dataset folder, resumed if it already exists')
+    parser_selfplay.add_argument('--positions',type=int,required=True,help='unique positions wanted in total')
+    parser_selfplay.add_argument('--depth',type=int,default=6,help='depth of the labelling search')
+    parser_selfplay.add_argument('--workers',type=int,default=os.cpu_count() or 1)
+    parser_selfplay.add_argument('--seed',type=int,default=0)
+    parser_selfplay.add_argument('--scores',action='store_true',help='store the score of every column')
+    parser_selfplay.add_argument('--opening-plies',type=int,default=8,help='most random moves at the start of a game')
+    parser_selfplay.add_argument('--random-rate',type=float,default=0.1,help='chance of a random move later on')
+    parser_selfplay.add_argument('--shard-size',type=int,default=dataset.SHARD_SIZE)
+    parser_selfplay.add_argument('--quiet',action='store_true',help='do not show progress')
+    parser_selfplay.set_defaults(func=self_play)
+
+    parser_train = commands.add_parser('train',help='train the CNN on a sharded dataset')
+    parser_train.add_argument('--train-data',default='./data/train')
+    parser_train.add_argument('--test-data',default='./data/test')
+    parser_train.add_argument('--checkpoint',default='cnnmodel_demo.pt',help='file to save the trained model to')
+    parser_train.add_argument('--epochs',type=int,default=2)
+    parser_train.add_argument('--batch-size',type=int,default=64)
+    parser_train.add_argument('--learning-rate',type=float,default=0.01)
+    parser_train.add_argument('--optimiser',choices=['sgd','adam'],default='sgd')
+    parser_train.add_argument('--momentum',type=float,default=0.0)
+    parser_train.add_argument('--lr-decay',type=float,default=1.0,help='learning rate multiplier per epoch')
+    parser_train.add_argument('--workers',type=int,default=0,help='DataLoader worker processes')
+    parser_train.add_argument('--seed',type=int)
+    parser_train.set_defaults(func=train)
+
+    parser_book = commands.add_parser('book',help='build an opening book by deep alpha-beta search')
+    parser_book.add_argument('--output',default='opening_book.npz',help='file to save the book to')
+    parser_book.add_argument('--plies',type=int,default=opening.DEFAULT_PLIES,help='most discs of a book position')
+    parser_book.add_argument('--depth',type=int,default=opening.DEFAULT_DEPTH,help='depth of the search')
+    parser_book.add_argument('--workers',type=int,default=os.cpu_count() or 1)
+    parser_book.add_argument('--test-games',type=int,default=20,help='games played to measure the hit rate')
+    parser_book.add_argument('--quiet',action='store_true',help='do not show progress')
+    parser_book.set_defaults(func=build_book)
+
+    parser_endgame = commands.add_parser('endgame',help='build an endgame table of solved positions for the Solver')
+    parser_endgame.add_argument('--output',default='endgame_table.npz',help='file to save the table to')
+    parser_endgame.add_argument('--empty-cells',type=int,default=solver.DEFAULT_EMPTY_CELLS,
+                                help='empty cells of the positions stored')
+    parser_endgame.add_argument('--positions',type=int,default=20,help='random positions the table is built from')
+    parser_endgame.add_argument('--plies',type=int,default=4,help='moves from each random position to the stored ones')
+    parser_endgame.add_argument('--seed',type=int,default=4801)
+    parser_endgame.add_argument('--quiet',action='store_true',help='do not show progress')
+    parser_endgame.set_defaults(func=build_endgame_table)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Compact on-disk format for CNN training data.
+
+A dataset is a folder of shards. Shard n is stored as shard_n_boards.npy (int8, shape
+(N,6,7)) and shard_n_labels.npy (uint8 column of the move, shape (N,)), optionally
+with shard_n_scores.npy (float32 score of every column, shape (N,7)). manifest.json
+lists the shards and their sizes. Shards are opened with memory mapping, so loading
+a dataset reads nothing until samples are used.
+"""
+import json
+import os
+import pickle
+import re
+import zipfile
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+MANIFEST = 'manifest.json'
+SHARD_SIZE = 1000000    #Positions per shard
+
+def _shard_path(folder,shard,kind):
+    return os.path.join(folder,'shard_'+str(shard).zfill(5)+'_'+kind+'.npy')
+
+def read_manifest(folder):
+    """
+    Reads the list of shards of a dataset.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the dataset.
+
+    Returns
+    -------
+    manifest : dict
+        'shards' (number of positions in each shard) and 'scores' (whether column
+        scores are stored). Empty if the folder has no dataset yet.
+    """
+    path = os.path.join(folder,MANIFEST)
+    if not os.path.exists(path):
+        return {'shards': [], 'scores': False}
+    with open(path) as f:
+        return json.load(f)
+
+class ShardWriter:
+    def __init__(self,folder,shard_size=SHARD_SIZE,scores=False):
+        self.folder = folder
+        self.shard_size = shard_size
+        os.makedirs(folder,exist_ok=True)
+        self.manifest = read_manifest(folder)   #Appends to an existing dataset
+        if self.manifest['shards']:
+            scores = self.manifest['scores']
+        self.manifest['scores'] = scores
+        self.boards = []
+        self.labels = []
+        self.scores = []
+
+    def add(self,board,label,scores=None):
+        """
+        Adds one position, writing out a shard once enough positions are buffered.
+
+        Parameters
+        ----------
+        board : list
+            6x7 grid of the position (0 empty, 1 and 2 for the players).
+        label : int
+            Column played in the position.
+        scores : list, optional
+            Score of every column, required if the dataset stores scores.
+
+        Returns
+        -------
+        None.
+        """
+        self.boards.append(np.asarray(board,dtype=np.int8))
+        self.labels.append(label)
+        if self.manifest['scores']:
+            self.scores.append(np.asarray(scores,dtype=np.float32))
+        if len(self.labels)>=self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the buffered positions as a new shard and updates the manifest.
+
+        Returns
+        -------
+        None.
+        """
+        if not self.labels:
+            return
+        shard = len(self.manifest['shards'])
+        np.save(_shard_path(self.folder,shard,'boards'),np.stack(self.boards))
+        np.save(_shard_path(self.folder,shard,'labels'),np.asarray(self.labels,dtype=np.uint8))
+        if self.manifest['scores']:
+            np.save(_shard_path(self.folder,shard,'scores'),np.stack(self.scores))
+        self.manifest['shards'].append(len(self.labels))
+        path = os.path.join(self.folder,MANIFEST)
+        with open(path+'.tmp','w') as f:   #Replaced in one step so a crash never leaves a broken manifest
+            json.dump(self.manifest,f)
+        os.replace(path+'.tmp',path)
+        self.boards = []
+        self.labels = []
+        self.scores = []
+
+    def close(self):
+        """
+        Writes any buffered positions.
+
+        Returns
+        -------
+        None.
+        """
+        self.flush()
+
+class BoardDataset(Dataset):
+    def __init__(self,folder):
+        self.folder = folder
+        self.manifest = read_manifest(folder)
+        self.offsets = np.cumsum([0]+self.manifest['shards'])
+        self._open()
+
+    def _open(self):
+        self.boards = []
+        self.labels = []
+        for shard in range(len(self.manifest['shards'])):
+            self.boards.append(np.load(_shard_path(self.folder,shard,'boards'),mmap_mode='r'))
+            self.labels.append(np.load(_shard_path(self.folder,shard,'labels'),mmap_mode='r'))
+
+    def __getstate__(self):     #DataLoader workers map the files again rather than copying them
+        return {'folder': self.folder,'manifest': self.manifest,'offsets': self.offsets}
+
+    def __setstate__(self,state):
+        self.__dict__.update(state)
+        self._open()
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    def __getitem__(self,index):
+        """
+        Gets one position as the CNN input and the column played.
+
+        Parameters
+        ----------
+        index : int
+            Number of the position in the dataset.
+
+        Returns
+        -------
+        board : torch tensor
+            Float tensor of shape (1,6,7).
+        label : int
+            Column played.
+        """
+        shard = int(np.searchsorted(self.offsets,index,side='right')) - 1
+        row = index - self.offsets[shard]
+        board = torch.from_numpy(np.array(self.boards[shard][row],dtype=np.float32)).view(1,6,7)
+        return board,int(self.labels[shard][row])
+
+    def arrays(self):
+        """
+        Gets the memory-mapped arrays of every shard, for reading in large blocks.
+
+        Returns
+        -------
+        list
+            (boards, labels) pair of each shard.
+        """
+        return list(zip(self.boards,self.labels))
+
+def _game_number(name):
+    match = re.search(r'Game(\d+)_',name)
+    return int(match.group(1)) if match else 0
+
+def read_pickle_records(f):
+    """
+    Reads every [grid, one hot column] record from a game file written by SetGame.
+
+    Parameters
+    ----------
+    f : file
+        Open game file.
+
+    Returns
+    -------
+    records : list
+        (grid, column) pair of each record.
+    """
+    records = []
+    while True:
+        try:
+            grid,one_hot = pickle.load(f)
+        except EOFError:
+            break
+        records.append((grid,list(one_hot).index(1)))
+    return records
+
+def convert_pickles(source,folder,shard_size=SHARD_SIZE):
+    """
+    Converts the per-game pickle files into a sharded dataset, in game order.
+
+    Parameters
+    ----------
+    source : str
+        Folder of GameN_Depth_6.pkl files (e.g. ./test) or a zip of them (e.g. train.zip).
+    folder : str
+        Folder to write the dataset to. Must not already hold a dataset.
+    shard_size : int, optional
+        Positions per shard.
+
+    Returns
+    -------
+    int
+        Number of positions converted.
+    """
+    if read_manifest(folder)['shards']:
+        raise FileExistsError(folder+' already holds a dataset')
+    writer = ShardWriter(folder,shard_size)
+    count = 0
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            names = sorted((name for name in archive.namelist() if name.endswith('.pkl')),key=_game_number)
+            for name in names:
+                with archive.open(name) as f:
+                    for grid,column in read_pickle_records(f):
+                        writer.add(grid,column)
+                        count += 1
+    else:
+        names = sorted((name for name in os.listdir(source) if name.endswith('.pkl')),key=_game_number)
+        for name in names:
+            with open(os.path.join(source,name),'rb') as f:
+                for grid,column in read_pickle_records(f):
+                    writer.add(grid,column)
+                    count += 1
+    writer.close()
+    return count
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Batched inference for the neural network players: positions from many games are
+collected and evaluated by the CNN in a single forward pass.
+"""
+import numpy as np
+import torch
+
+import neural_net_trainer as neural_net
+
+def best_columns(cnn,grids):
+    """
+    Chooses the legal column the CNN scores highest for each of a batch of positions.
+
+    Parameters
+    ----------
+    cnn : ConvNet
+        Model to evaluate the positions with.
+    grids : numpy array
+        Positions to evaluate, shaped (N,6,7).
+
+    Returns
+    -------
+    columns : numpy array
+        The chosen column of each position. Full columns are never chosen.
+    """
+    grids = np.asarray(grids)
+    with torch.inference_mode():
+        data = torch.as_tensor(grids,dtype=torch.float32).view(-1,1,6,7)
+        output = cnn(data).numpy()
+    output[grids[:,0,:]!=0] = -np.inf    #A column is full when its top cell is taken
+    return output.argmax(axis=1)
+
+def column_policy(cnn,grids):
+    """
+    Turns the CNN scores of a batch of positions into move probabilities over the legal columns.
+
+    Parameters
+    ----------
+    cnn : ConvNet
+        Model to evaluate the positions with.
+    grids : numpy array
+        Positions to evaluate, shaped (N,6,7).
+
+    Returns
+    -------
+    policy : numpy array
+        Probability of each column, shaped (N,7). Full columns have probability 0.
+    """
+    grids = np.asarray(grids)
+    with torch.inference_mode():
+        data = torch.as_tensor(grids,dtype=torch.float32).view(-1,1,6,7)
+        output = cnn(data).numpy()
+    output[grids[:,0,:]!=0] = -np.inf
+    output = np.exp(output - output.max(axis=1,keepdims=True))
+    return output / output.sum(axis=1,keepdims=True)
+
+class InferenceQueue:
+    def __init__(self,checkpoint=neural_net.DEFAULT_CHECKPOINT):
+        self.cnn = neural_net.load_model(checkpoint)
+        self.pending = []
+
+    def submit(self,grid):
+        """
+        Adds a position to be evaluated in the next batch.
+
+        Parameters
+        ----------
+        grid : list
+            Current state of a game.
+
+        Returns
+        -------
+        int
+            Position of the grid in the batch, used to look up its column after flush.
+        """
+        self.pending.append(grid)
+        return len(self.pending) - 1
+
+    def flush(self):
+        """
+        Evaluates every pending position in one batch and empties the queue.
+
+        Returns
+        -------
+        columns : numpy array
+            The chosen column for each position, in the order they were submitted.
+        """
+        if not self.pending:
+            return np.zeros(0,dtype=np.int64)
+        columns = best_columns(self.cnn,np.stack(self.pending))
+        self.pending = []
+        return columns
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the players' searches. When a Player is created with
+instrument=True, every move records a SearchStats, and the search runs on an
+InstrumentedBitboard that times the win checks and evaluations. Players without
+instrumentation use the plain Bitboard, so they pay nothing for it.
+"""
+import json
+import time
+
+import connect4_bitboard as bb
+
+class SearchStats:
+    def __init__(self,algorithm,depth,discs):
+        self.algorithm = algorithm
+        self.depth = depth  #Depth the search was asked for
+        self.discs = discs  #Discs on the board when the move was chosen
+        self.column = None
+        self.score = None
+        self.completed_depth = 0
+        self.seconds = 0.0
+        self.nodes = 0
+        self.interior_nodes = 0     #Nodes whose moves were generated
+        self.legal_moves = 0    #Moves available at those nodes
+        self.cutoffs = 0
+        self.max_discs = discs
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.win_checks = 0
+        self.win_check_seconds = 0.0
+        self.evaluations = 0
+        self.evaluation_seconds = 0.0
+
+    def as_dict(self):
+        """
+        Gets the statistics, with the figures derived from them.
+
+        Returns
+        -------
+        dict
+            Every counter, plus the deepest ply reached, the branching factor (moves
+            searched per interior node), the legal moves per interior node, nodes per
+            second and the share of the time spent in win checks and evaluation.
+        """
+        stats = dict(self.__dict__)
+        stats['max_ply'] = self.max_discs - self.discs
+        stats['branching_factor'] = (self.nodes - 1) / self.interior_nodes if self.interior_nodes else 0.0
+        stats['legal_moves_per_node'] = self.legal_moves / self.interior_nodes if self.interior_nodes else 0.0
+        stats['nodes_per_second'] = self.nodes / self.seconds if self.seconds else 0.0
+        stats['tt_hit_rate'] = self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+        stats['win_check_share'] = self.win_check_seconds / self.seconds if self.seconds else 0.0
+        stats['evaluation_share'] = self.evaluation_seconds / self.seconds if self.seconds else 0.0
+        return stats
+
+class InstrumentedBitboard(bb.Bitboard):
+    """
+    Bitboard that records the work of the search in the SearchStats set as its
+    stats attribute.
+    """
+    stats = None
+
+    def last_move_won(self):
+        start = time.perf_counter()
+        won = bb.Bitboard.last_move_won(self)
+        stats = self.stats
+        stats.win_check_seconds += time.perf_counter() - start
+        stats.win_checks += 1
+        if self.counter>stats.max_discs:
+            stats.max_discs = self.counter
+        return won
+
+    def evaluate(self,player,opponent):
+        start = time.perf_counter()
+        score = bb.Bitboard.evaluate(self,player,opponent)
+        self.stats.evaluation_seconds += time.perf_counter() - start
+        self.stats.evaluations += 1
+        return score
+
+    def get_possible_columns(self):
+        columns = bb.Bitboard.get_possible_columns(self)
+        self.stats.interior_nodes += 1
+        self.stats.legal_moves += len(columns)
+        return columns
+
+def write_trace(path,record):
+    """
+    Appends one record to a trace log, as a line of JSON.
+
+    Parameters
+    ----------
+    path : str
+        File of the trace log.
+    record : dict
+        Record to write.
+
+    Returns
+    -------
+    None.
+    """
+    with open(path,'a') as f:
+        f.write(json.dumps(record)+'\n')
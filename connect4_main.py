@@ -5,104 +5,15 @@ import time
 import sys
 import pickle
 import os
+import threading
+import queue
 
 import tkinter as tk
 from tkinter import ttk
 
 import connect4_algorithms as al        
+import connect4_simulation as sim
 
-# A class that sets up the Connect 4 grid and manages the gameplay
-# play_move: Places the players disc at given position
-# move_checked: Checks the given position to make sure it is a legal move
-# make_move: Initiates player's algorithm to obtain position the player wants to play in
-#and ensures players alternate turns
-# determine_player: determines which players turn it is
-class SetGame:
-    def __init__(self,next_player,file_name,players):
-        self.grid = np.zeros((6,7))
-        self.next_player = next_player
-        self.x = 0
-        self.y = 0
-        self.file_name = file_name
-        self.players = players
-       
-    def play_move(self,player_value):
-        """
-        Plays the player's disc at specified position.
-
-        Parameters
-        ----------
-        player_value : int
-            Player's associated value.
-
-        Returns
-        -------
-        None.
-        """
-        self.grid[self.y][self.x] = player_value
-       
-    def move_checked(self):
-        """
-        Checks whether the move to make is legal.
-
-        Returns
-        -------
-        bool
-            Returns True if the move is legal or False if it is not.
-        """
-        if self.grid[self.y][self.x]!=0:
-            return False
-        elif self.y==5:
-            return True
-        elif self.grid[self.y+1][self.x]==0:
-            return False
-        else:
-            return True
-                
-    def make_move(self):
-        """
-        Obtains the position to place a disc and plays it.
-
-        Returns
-        -------
-        None.
-        """
-        move_made = False           
-        while not move_made:
-            self.y,self.x, = self.players[self.next_player].use_player_algorithm(self.grid)
-            if SetGame.move_checked(self):
-                move_made = True
-        SetGame.play_move(self,self.players[self.next_player].player_number)
-        #if self.players[self.next_player].player_algorithm == 3:   #Used to create training files
-            #file_array = []
-            #for n in range(7):
-                #if n==self.x:
-               #     file_array.append(1)
-              #  else:
-             #       file_array.append(0)
-            
-            #with open(self.file_name,"ab") as f:
-            #    pickle.dump([self.grid,file_array],f)
-            #f.close()
-        self.players[self.next_player].player_moves += 1
-    
-    def determine_player(self): 
-        """
-        Determines which player is to play next.
-
-        Returns
-        -------
-        None.
-        """
-        SetGame.make_move(self)
-        player = self.next_player
-        if self.next_player > 0:
-            self.next_player -= 1
-        else:
-            self.next_player += 1
-        return self.x,self.y,player
-            
-            
 class GUIController(tk.Tk):
     def __init__(self, *args, **kwargs):
         tk.Tk.__init__(self,*args,**kwargs)
@@ -143,13 +54,8 @@ class StartMenu(tk.Frame):
     def __init__(self,parent,controller):
         self.controller = controller
         tk.Frame.__init__(self,parent)
-        algorithms = [
-            'Random',
-            'Minimax',
-            'Minimax with A-B Pruning',
-            'User Input',
-            'Artificial Neural Network'
-        ]
+        algorithms = list(al.ALGORITHMS)
+        algorithms.insert(algorithms.index('Principal Variation Search')+1,'User Input')  #Not a computer algorithm, so not in al.ALGORITHMS
         lb1 = tk.Label(self,text="Player 1", font='Calibri 20')
         lb1.grid(row=0,column=2, padx=10, pady=10)
         
@@ -206,8 +112,8 @@ class StartMenu(tk.Frame):
         self.sim_input = tk.Entry(self,width=4,font='Calibri 20',validate='key',validatecommand=(self.validate_input))
         self.sim_input.grid(row=1,column=6,padx=10,pady=0)
         
-        begin_sim = tk.Button(self,text='Run Simulation',relief='raised',command=self.run_simulation)
-        begin_sim.grid(row=2,column=0, padx=10, pady=10)
+        self.begin_sim = tk.Button(self,text='Run Simulation',relief='raised',command=self.run_simulation)
+        self.begin_sim.grid(row=2,column=0, padx=10, pady=10)
         
     def validate(self,d,P,s):
         """
@@ -253,15 +159,8 @@ class StartMenu(tk.Frame):
             False if user has entered invalid settings, True otherwise.
 
         """
-        if not str.isdigit(P):
-            msg = 'Please check your inputs'
-        elif int(P)>1000:
-            msg = 'Max number of simulations is 1000'
-        elif int(P)==0:
-            msg = 'Must be at least 1 game'
-        elif int(P)!=1 and (self.variable_p1.get()=='User Input' or self.variable_p2.get()=='User Input'):
-            msg = 'Must be 1 game for User Input'
-        else:
+        msg = sim.validate_num_games(P,[self.variable_p1.get(),self.variable_p2.get()],sim.MAX_GUI_GAMES)
+        if msg is None:
             return True
         self.bell()
         tk.messagebox.showerror('Error',msg)
@@ -278,8 +177,10 @@ class StartMenu(tk.Frame):
         if len(self.controller.players)>0:
             self.controller.players.pop()
             self.controller.players.pop()
-        player1 = al.Player(1, 2, self.variable_p1.get(),int(self.depth_player1.get()),'yellow')
-        player2 = al.Player(2, 1, self.variable_p2.get(),int(self.depth_player2.get()),'red')
+        player1 = al.Player(1, 2, self.variable_p1.get(),int(self.depth_player1.get()),'yellow',
+                            pondering=self.variable_p2.get()=='User Input')    #Computer players ponder on the user's time
+        player2 = al.Player(2, 1, self.variable_p2.get(),int(self.depth_player2.get()),'red',
+                            pondering=self.variable_p1.get()=='User Input')
         self.controller.players.append(player1)
         self.controller.players.append(player2)
         
@@ -305,38 +206,14 @@ class StartMenu(tk.Frame):
             if int(self.sim_input.get())>1:
                 self.sim_time.configure(text='Simulation time: Running..') #Only needed when running multiple sims
                 self.update()
-                next_player = 0
-                sim_time = time.time()
-                for n in range(int(self.sim_input.get())):
-                    game_on = True
-                    self.game = SetGame(next_player,'',self.controller.players)
-                    while game_on:
-                        x,y,player = self.game.determine_player()
-                        if al.is_victory(self.game.grid, self.controller.players[0].player_number):
-                            game_on = False
-                            self.controller.players[0].player_score += 1
-                        elif al.is_victory(self.game.grid,self.controller.players[1].player_number):
-                            game_on = False
-                            self.controller.players[1].player_score += 1
-                        elif al.is_grid_full(self.game.grid):
-                            game_on = False
-                    if next_player>0:
-                        next_player-=1
-                    else:
-                        next_player+=1
-                sim_time = round(time.time() - sim_time,2)
-                player1_score = round(self.controller.players[0].get_player_score() / int(self.sim_input.get()) * 100,2)
-                player2_score = round(self.controller.players[1].get_player_score() / int(self.sim_input.get()) * 100,2)
-                drawn = round(100 - (player1_score+player2_score),2)
-                self.msg_one = 'Player 1 won '+str(player1_score)+'% games'
-                self.msg_two = 'Player 2 won '+str(player2_score)+'% games'
-                self.msg_three = 'Players drew '+str(drawn)+'% games'
-                self.msg_four = 'Simulation time: '+str(sim_time)+' seconds'
-                
-                self.player1_win.configure(text=self.msg_one)
-                self.player2_win.configure(text=self.msg_two)
-                self.players_draw.configure(text=self.msg_three)
-                self.sim_time.configure(text=self.msg_four)
+                configs = [{'algorithm': self.variable_p1.get(),'depth': int(self.depth_player1.get())},
+                           {'algorithm': self.variable_p2.get(),'depth': int(self.depth_player2.get())}]
+                self.sim_queue = queue.Queue()
+                self.sim_games = int(self.sim_input.get())
+                simulation = threading.Thread(target=self.simulate,args=(configs,self.sim_games),daemon=True)
+                self.begin_sim.configure(state='disabled')    #One batch at a time
+                simulation.start()
+                self.after(100,self.poll_simulation)
                 return True
             else:
                 self.controller.show_frame(GameGUI)
@@ -344,6 +221,75 @@ class StartMenu(tk.Frame):
             return False
              
         
+    def simulate(self,configs,num_games):
+        """
+        Runs the batch of games in a background thread, so the window stays responsive,
+        passing progress and the final results back through the simulation queue. If the
+        batch fails, e.g. the worker processes cannot start, the error is passed back instead.
+        Parameters
+        ----------
+        configs : list
+            Algorithm and depth of each player.
+        num_games : int
+            Number of games to simulate.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            results = sim.run_batch(configs,num_games,workers=os.cpu_count() or 1,
+                                    progress=lambda results: self.sim_queue.put(('progress',dict(results))),
+                                    mp_context='spawn')
+        except Exception as error:     #Reported by poll_simulation, which would otherwise wait forever
+            self.sim_queue.put(('error',error))
+            return
+        self.sim_queue.put(('done',results))
+        
+    def poll_simulation(self):
+        """
+        Checks the simulation queue and updates the statistics labels, until the
+        batch of games has finished or failed.
+        Returns
+        -------
+        None.
+
+        """
+        num_games = self.sim_games
+        finished = False
+        while not self.sim_queue.empty():
+            state,results = self.sim_queue.get()
+            if state=='progress':
+                self.sim_time.configure(text='Simulation time: Running.. '+str(results['games'])+'/'+str(num_games)+' games')
+            else:
+                finished = True
+        if not finished:
+            self.after(100,self.poll_simulation)
+            return
+        self.begin_sim.configure(state='normal')
+        if state=='error':
+            self.sim_time.configure(text='Simulation time: Failed')
+            tk.messagebox.showerror('Error','The simulation failed: '+str(results))
+            return
+        for n in range(2):
+            self.controller.players[n].player_score = results['wins'][n]
+            self.controller.players[n].player_moves = results['moves'][n]
+        sim_time = round(results['seconds'],2)
+        player1_score = round(self.controller.players[0].get_player_score() / num_games * 100,2)
+        player2_score = round(self.controller.players[1].get_player_score() / num_games * 100,2)
+        drawn = round(100 - (player1_score+player2_score),2)
+        self.msg_one = 'Player 1 won '+str(player1_score)+'% games'
+        self.msg_two = 'Player 2 won '+str(player2_score)+'% games'
+        self.msg_three = 'Players drew '+str(drawn)+'% games'
+        self.msg_four = 'Simulation time: '+str(sim_time)+' seconds'
+        
+        self.player1_win.configure(text=self.msg_one)
+        self.player2_win.configure(text=self.msg_two)
+        self.players_draw.configure(text=self.msg_three)
+        self.sim_time.configure(text=self.msg_four)
+             
+        
 class GameGUI(tk.Frame):
     def __init__(self,parent,controller):
         tk.Frame.__init__(self,parent)
@@ -351,6 +297,8 @@ class GameGUI(tk.Frame):
         self.box_columns = []
         self.simulation = False
         self.move_made = False
+        self.win_label = None
+        self.pending = None     #Scheduled call of the game loop, cancelled when leaving the game
         self.start_game = tk.Button(self,text='Start',bg='#24D153',command=lambda:self.draw_grid())
         self.start_game.grid(row=0,column=0)
         self.columnconfigure(0,weight=1)
@@ -398,35 +346,45 @@ class GameGUI(tk.Frame):
         """
         self.next_player = 0
         self.player = self.next_player
-        self.game = SetGame(self.next_player,'',self.controller.players)
+        self.game = sim.SetGame(self.next_player,'',self.controller.players)
+        self.move_queue = queue.Queue()
+        self.thinking = None    #Thread choosing the computer's move
+        self.thinking_text = self.window.create_text(880,200,text='',font='Calibri 15')
+        self.return_home_button = tk.Button(self,text='Return Home',command=lambda:self.return_home())
+        self.return_home_button.grid(row=2,column=0)
         self.window.update()
         self.maintain_game()
 
     def maintain_game(self):
         """
         Ensures gameplay is being played, managing if an end state has been reached,
-        and getting the algorithms or user to take their turn.
+        and getting the algorithms or user to take their turn. A computer player's
+        move is chosen in a background thread, so the window stays responsive, and
+        it ponders the user's replies in its own thread while the user decides.
         Returns
         -------
         None.
 
         """
-        if not (al.is_victory(self.game.grid,self.controller.players[0].get_player_number()) or
-                al.is_victory(self.game.grid,self.controller.players[1].get_player_number()) or
-                al.is_grid_full(self.game.grid)):
+        if not (self.game.board.has_won(self.controller.players[0].get_player_number()) or
+                self.game.board.has_won(self.controller.players[1].get_player_number()) or
+                self.game.board.is_full()):
             if self.controller.players[self.player].get_player_algorithm()=='User Input':
                 self.wait_for_player()
+                self.pending = self.after(100,self.maintain_game)
             else:
-                time.sleep(0.2)
-                x,self.row,self.player = self.game.determine_player()
-                self.position_pieces(x)
-            self.after(100,self.maintain_game)
+                player = self.controller.players[self.player]
+                player.cancelled = False
+                self.thinking = threading.Thread(target=self.think,args=(self.game,player,self.game.board.copy()),daemon=True)
+                self.thinking.start()
+                self.thinking_dots = 0
+                self.pending = self.after(100,self.poll_move)
         else:
             self.window.unbind("<Button-1>")
-            if al.is_victory(self.game.grid, self.controller.players[0].player_number):
+            if self.game.board.has_won(self.controller.players[0].player_number):
                 self.controller.players[0].player_score += 1
                 victory_message = 'Player 1 Wins!'
-            elif al.is_victory(self.game.grid, self.controller.players[1].player_number):
+            elif self.game.board.has_won(self.controller.players[1].player_number):
                 self.controller.players[1].player_score += 1
                 victory_message = 'Player 2 Wins!'
             else:
@@ -435,9 +393,65 @@ class GameGUI(tk.Frame):
             self.win_label.grid(row=0,column=0)
             self.columnconfigure(0,weight=1)
             self.rowconfigure(0,weight=1)
-            self.return_home_button = tk.Button(self,text='Return Home',command=lambda:self.return_home())
-            self.return_home_button.grid(row=2,column=0)
-            
+
+    def think(self,game,player,grid):
+        """
+        Chooses a computer player's move in a background thread, passing the column
+        back through the move queue. Runs until the player returns a legal column,
+        or until it is cancelled.
+        Parameters
+        ----------
+        game : SetGame
+            Game the move is for.
+        player : Player
+            Player whose move it is.
+        grid : Board
+            Copy of the game's board, which the search reads.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            while True:
+                y,x = player.use_player_algorithm(grid)
+                if grid[0][x]==0:
+                    break
+        except al.SearchTimeout:
+            return
+        self.move_queue.put((game,x))
+
+    def poll_move(self):
+        """
+        Checks the move queue while a computer player is thinking, animating the
+        thinking indicator, and plays the move once it has been chosen, noting when
+        a Solver could not solve the position in time.
+        Returns
+        -------
+        None.
+
+        """
+        move = None
+        while not self.move_queue.empty():
+            game,x = self.move_queue.get()
+            if game is self.game:   #Moves from a game that was left are dropped
+                move = x
+        if move is None:
+            self.thinking_dots = (self.thinking_dots + 1) % 4
+            self.window.itemconfigure(self.thinking_text,text='Player '+str(self.player+1)+' thinking'+'.'*self.thinking_dots)
+            self.pending = self.after(100,self.poll_move)
+            return
+        self.thinking = None
+        player = self.controller.players[self.player]
+        if player.get_player_algorithm()=='Solver' and player.solution is None:    #Not solved in time
+            self.window.itemconfigure(self.thinking_text,text='Player '+str(self.player+1)+' fell back to alpha-beta')
+        else:
+            self.window.itemconfigure(self.thinking_text,text='')
+        x,self.row,self.player = self.game.play_column(move)
+        self.position_pieces(x)
+        self.pending = self.after(200,self.maintain_game)    #Pause so computer v computer moves can be followed
+
     def update_players_turn(self):
         """
         Updates who's turn it is next to place their disc, after
@@ -511,7 +525,7 @@ class GameGUI(tk.Frame):
                 self.game.x = self.column
                 self.game.y = self.row
                 if self.game.move_checked():
-                    self.game.grid[self.row][self.column] = self.controller.players[self.player].player_number
+                    self.game.play_move(self.controller.players[self.player].player_number)
                     self.window.create_oval(x[0]+7,x[1]+(self.row*90)+7,x[2]-7,x[3]+(self.row*90)-7, fill=self.controller.players[self.player].player_colour)
                     self.move_made = True
                     if self.game.next_player>0:
@@ -534,7 +548,16 @@ class GameGUI(tk.Frame):
             self.next_player = 0
         else:
             self.next_player = 1
-        self.win_label.grid_forget()
+        self.after_cancel(self.pending)
+        for player in self.controller.players:  #Stops any search or pondering still running for the game
+            player.cancel()
+        self.game = None
+        self.thinking = None
+        if self.win_label is not None:
+            self.win_label.grid_forget()
+            self.win_label = None
+        self.window.unbind("<Button-1>")
+        self.move_made = False
         self.return_home_button.grid_forget()
         self.window.destroy()   #Needed to hide the grid
         self.start_game.grid(row=0,column=0)
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Monte Carlo Tree Search player. Moves are chosen by UCT over random playouts
+played on bitboards, within a number of playouts or a time budget. Leaves are
+selected in batches (with a virtual loss, so a batch spreads over the tree) and
+their playouts are played together by the vectorised bb.random_games. The tree
+is kept between moves, and the CNN can optionally guide the search as a prior
+policy (PUCT).
+"""
+import math
+import random
+import time
+
+import numpy as np
+
+import connect4_bitboard as bb
+import connect4_inference as inference
+import neural_net_trainer as neural_net
+
+DEFAULT_PLAYOUTS = 50000
+BATCH_LEAVES = 128  #Leaves selected before their playouts are played together
+LEAF_PLAYOUTS = 16  #Playouts from each leaf, a batch being about as large as random_games is fastest at
+EXPLORATION = 1.4   #UCT exploration constant, about sqrt(2)
+PRIOR_EXPLORATION = 2.0     #Exploration constant when the CNN prior is used
+COLUMN_MASKS = tuple(((1 << bb.ROWS) - 1) << x*bb.COLUMN_BITS for x in range(bb.COLUMNS))
+TOPS = tuple(x*bb.COLUMN_BITS + bb.ROWS for x in range(bb.COLUMNS))    #Bit above the top cell of each column
+
+def is_four(board):
+    """
+    Checks a player's discs for a line of 4.
+
+    Parameters
+    ----------
+    board : int
+        Bitmask of the player's discs.
+
+    Returns
+    -------
+    bool
+        True if the discs contain a line of 4.
+    """
+    for shift in (1, bb.COLUMN_BITS, bb.COLUMN_BITS-1, bb.COLUMN_BITS+1):
+        pairs = board & (board >> shift)
+        if pairs & (pairs >> 2*shift):
+            return True
+    return False
+
+def to_grid(boards):
+    """
+    Converts a pair of bitboards into the 6x7 grid the CNN takes.
+
+    Parameters
+    ----------
+    boards : list
+        Bitmasks of the discs of player 1 and player 2.
+
+    Returns
+    -------
+    grid : numpy array
+        6x7 grid, row 0 being the top.
+    """
+    grid = np.zeros((bb.ROWS,bb.COLUMNS),dtype=np.int8)
+    for val,board in ((1,boards[0]),(2,boards[1])):
+        for x in range(bb.COLUMNS):
+            for y in range(bb.ROWS):
+                if board >> bb.cell_bit(y,x) & 1:
+                    grid[y][x] = val
+    return grid
+
+class Node:
+    __slots__ = ('move','children','visits','wins','prior','terminal')
+
+    def __init__(self,move=None,prior=1.0,terminal=None):
+        self.move = move    #Column played to reach the node
+        self.children = None
+        self.visits = 0
+        self.wins = 0.0     #Total result for the player who played the move
+        self.prior = prior
+        self.terminal = terminal    #Result of the game if the move ended it, for the player who played it
+
+class MCTS:
+    def __init__(self,checkpoint=None,exploration=None,seed=None):
+        self.cnn = None if checkpoint is None else neural_net.load_model(checkpoint)
+        if exploration is None:
+            exploration = EXPLORATION if self.cnn is None else PRIOR_EXPLORATION
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+        self.root_boards = None
+        self.root_turn = None
+        self.playouts = 0
+        self.seconds = 0.0
+        self.reused = 0
+
+    def reset(self):
+        """
+        Discards the tree, e.g. for a new game.
+
+        Returns
+        -------
+        None.
+        """
+        self.root = None
+        self.root_boards = None
+        self.root_turn = None
+
+    def get_stats(self):
+        """
+        Gets the counters of the search.
+
+        Returns
+        -------
+        dict
+            Playouts, seconds spent, playouts per second, visits of the current
+            root and visits reused from earlier moves.
+        """
+        return {
+            'playouts': self.playouts,
+            'seconds': self.seconds,
+            'playouts_per_second': self.playouts / self.seconds if self.seconds else 0.0,
+            'root_visits': 0 if self.root is None else self.root.visits,
+            'reused': self.reused,
+        }
+
+    def best_move(self,board,val,playouts=DEFAULT_PLAYOUTS,deadline=None):
+        """
+        Searches a position and chooses the most visited move.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        val : int
+            Value of the player to move.
+        playouts : int, optional
+            Number of playouts to run, ignored if a deadline is given. Playouts are
+            run in batches, so the count is rounded up to a whole batch.
+        deadline : float, optional
+            time.perf_counter() value to search until.
+
+        Returns
+        -------
+        best_move : int
+            Column to play.
+        win_rate : float
+            Average result of the move's playouts for the player to move.
+        """
+        start = time.perf_counter()
+        boards = list(board.boards)
+        turn = val - 1
+        root = self.__reuse(boards,turn)
+        if root.children is None:
+            self.__expand(root,boards,turn)
+        for child in root.children:
+            if child.terminal==1.0:     #Winning move
+                return child.move,1.0
+        rng = np.random.default_rng(self.rng.getrandbits(64))
+        count = 0
+        while count<playouts if deadline is None else time.perf_counter()<deadline:
+            count += self.__iterate(root,boards,turn,rng)
+        self.playouts += count
+        self.seconds += time.perf_counter() - start
+        best = max(root.children,key=lambda child: child.visits)
+        return best.move,best.wins / best.visits if best.visits else 0.5
+
+    def __reuse(self,boards,turn):
+        """
+        Finds the position in the tree of the last search, one or two moves on,
+        so its statistics are kept.
+
+        Parameters
+        ----------
+        boards : list
+            Bitmasks of the discs of player 1 and player 2.
+        turn : int
+            Index of the player to move (0 or 1).
+
+        Returns
+        -------
+        Node
+            The node of the position, or a new root if it is not in the tree.
+        """
+        frontier = [(self.root,self.root_boards,self.root_turn)] if self.root is not None else []
+        root = None
+        for plies in range(3):
+            following = []
+            for node,node_boards,node_turn in frontier:
+                if node_boards==boards and node_turn==turn:
+                    root = node
+                    break
+                if node.children is None or plies==2:
+                    continue
+                mask = node_boards[0] | node_boards[1]
+                for child in node.children:
+                    child_boards = list(node_boards)
+                    child_boards[node_turn] |= (mask + bb.BOTTOM_MASK) & COLUMN_MASKS[child.move]
+                    following.append((child,child_boards,1-node_turn))
+            if root is not None:
+                break
+            frontier = following
+        if root is None:
+            root = Node()
+        else:
+            self.reused += root.visits
+        self.root = root
+        self.root_boards = list(boards)
+        self.root_turn = turn
+        return root
+
+    def __expand(self,node,boards,turn):
+        """
+        Creates the children of a node, one for each legal move.
+
+        Parameters
+        ----------
+        node : Node
+            Node to expand.
+        boards : list
+            Bitmasks of the discs of player 1 and player 2 at the node.
+        turn : int
+            Index of the player to move (0 or 1).
+
+        Returns
+        -------
+        None.
+        """
+        mask = boards[0] | boards[1]
+        possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+        if self.cnn is not None:
+            policy = inference.column_policy(self.cnn,to_grid(boards)[np.newaxis])[0]
+            order = sorted(bb.COLUMN_ORDER,key=lambda x: -policy[x])
+        else:
+            policy = None
+            order = bb.COLUMN_ORDER
+        children = []
+        for x in order:
+            move = possible & COLUMN_MASKS[x]
+            if not move:
+                continue
+            terminal = None
+            if is_four(boards[turn] | move):
+                terminal = 1.0
+            elif (mask | move)==bb.FULL_MASK:
+                terminal = 0.5
+            children.append(Node(x,1.0 if policy is None else float(policy[x]),terminal))
+        node.children = children
+
+    def __select(self,node):
+        """
+        Chooses the child to explore: the first unvisited one for UCT, otherwise the
+        one with the highest upper confidence bound (PUCT when the CNN prior is used).
+
+        Parameters
+        ----------
+        node : Node
+            Node whose children are chosen from.
+
+        Returns
+        -------
+        Node
+            The chosen child.
+        """
+        best = None
+        best_score = -math.inf
+        if self.cnn is None:
+            log_visits = math.log(max(node.visits,1))
+            for child in node.children:
+                if not child.visits:
+                    return child
+                score = child.wins/child.visits + self.exploration*math.sqrt(log_visits/child.visits)
+                if score>best_score:
+                    best,best_score = child,score
+        else:
+            scale = self.exploration*math.sqrt(node.visits)
+            for child in node.children:
+                value = child.wins/child.visits if child.visits else 0.5
+                score = value + scale*child.prior/(1 + child.visits)
+                if score>best_score:
+                    best,best_score = child,score
+        return best
+
+    def __iterate(self,root,boards,turn,rng):
+        """
+        Runs one batch of iterations: selects BATCH_LEAVES paths down the tree,
+        expanding their ends, plays LEAF_PLAYOUTS random playouts from each leaf and
+        backs the results up the paths. The visits of a path are counted as soon as
+        it is selected, as losses until the results are known, so the later paths of
+        the batch prefer other moves.
+
+        Parameters
+        ----------
+        root : Node
+            Root of the tree.
+        boards : list
+            Bitmasks of the discs of player 1 and player 2 at the root.
+        turn : int
+            Index of the player to move at the root (0 or 1).
+        rng : numpy Generator
+            Source of the random moves of the playouts.
+
+        Returns
+        -------
+        int
+            Number of playouts run.
+        """
+        paths = []
+        leaves = []     #Paths ending at a leaf that needs playouts, with its bitboards
+        own = []
+        other = []
+        for _ in range(BATCH_LEAVES):
+            node_boards = list(boards)
+            node_turn = turn
+            node = root
+            path = [root]
+            while node.terminal is None:
+                if node.children is None:
+                    if node.visits==0:
+                        break
+                    self.__expand(node,node_boards,node_turn)
+                node = self.__select(node)
+                node_boards[node_turn] |= ((node_boards[0] | node_boards[1]) + bb.BOTTOM_MASK) & COLUMN_MASKS[node.move]
+                node_turn = 1 - node_turn
+                path.append(node)
+                if node.visits==0:
+                    break
+            for visited in path:
+                visited.visits += LEAF_PLAYOUTS     #Virtual loss until the results are backed up
+            if node.terminal is not None:
+                paths.append((path,node.terminal*LEAF_PLAYOUTS))
+            else:
+                leaves.append(path)
+                own.append(node_boards[node_turn])
+                other.append(node_boards[1-node_turn])
+        if leaves:
+            winner,_ = bb.random_games(np.repeat(np.array(own,dtype=np.uint64),LEAF_PLAYOUTS),
+                                       np.repeat(np.array(other,dtype=np.uint64),LEAF_PLAYOUTS),rng)
+            winner = winner.reshape(len(leaves),LEAF_PLAYOUTS)
+            results = (winner==1).sum(axis=1) + 0.5*(winner==-1).sum(axis=1)   #For the player who moved into the leaf
+            paths.extend(zip(leaves,results.tolist()))
+        for path,result in paths:
+            for node in reversed(path):
+                node.wins += result
+                result = LEAF_PLAYOUTS - result
+        return BATCH_LEAVES*LEAF_PLAYOUTS
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Self-play generator of CNN training data. Games are played between two
+'Minimax with A-B Pruning' players across worker processes, and every position
+is labelled with the column the search chooses. Positions are deduplicated
+(a position and its left-right mirror count as one) and written with
+connect4_dataset.ShardWriter. Generation can be stopped and resumed.
+"""
+import collections
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import connect4_algorithms as al
+import connect4_bitboard as bb
+import connect4_dataset as dataset
+
+STATE_FILE = 'selfplay.json'
+GAMES_PER_TASK = 4
+
+def canonical_key(board):
+    """
+    Gets a key that is the same for a position and its left-right mirror image.
+
+    Parameters
+    ----------
+    board : numpy array
+        6x7 int8 grid of the position.
+
+    Returns
+    -------
+    bytes
+        The smaller of the bytes of the grid and of its mirror image.
+    """
+    return min(board.tobytes(),board[:,::-1].tobytes())
+
+_worker_players = {}
+
+def play_task(task,seed,depth,scores,opening_plies,random_rate):
+    """
+    Plays the self-play games of one task. The games only depend on the task and
+    the seed, so a task that is run again produces the same positions.
+
+    Parameters
+    ----------
+    task : int
+        Number of the task.
+    seed : int
+        Seed of the whole generation.
+    depth : int
+        Depth of the labelling search.
+    scores : bool
+        Include the score of every column with each position.
+    opening_plies : int
+        Most random moves played at the start of a game, so games differ.
+    random_rate : float
+        Chance of playing a random move instead of the labelled one later on.
+
+    Returns
+    -------
+    records : list
+        (key, board, label, column scores) of every position, in the order played.
+    """
+    key = (depth,)
+    players = _worker_players.get(key)
+    if players is None:
+        players = {1: al.Player(1,2,'Minimax with A-B Pruning',depth,None),
+                   2: al.Player(2,1,'Minimax with A-B Pruning',depth,None)}
+        _worker_players[key] = players
+    rng = random.Random(seed*1000003 + task)
+    records = []
+    for game in range(GAMES_PER_TASK):
+        for player in players.values():
+            player.new_game()
+        board = bb.Bitboard()
+        val = 1
+        opening = rng.randint(0,opening_plies)
+        while not board.is_full():
+            columns = board.get_possible_columns()
+            if board.counter<opening:
+                x = rng.choice(columns)
+            else:
+                grid = board.to_grid().astype(np.int8)
+                if scores:
+                    column_scores,x = players[val].get_column_scores(grid)
+                else:
+                    column_scores = None
+                    y,x = players[val].use_player_algorithm(grid)
+                records.append((canonical_key(grid),grid,x,column_scores))
+                if rng.random()<random_rate:
+                    x = rng.choice(columns)
+            if board.is_winning_move(x,val):
+                break
+            board.play(x,val)
+            val = 3 - val
+    return records
+
+def read_state(folder):
+    """
+    Reads the progress of a generation.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the dataset being generated.
+
+    Returns
+    -------
+    dict
+        Settings of the generation and the next task to run, or None if it has not started.
+    """
+    path = os.path.join(folder,STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def write_state(folder,state):
+    path = os.path.join(folder,STATE_FILE)
+    with open(path+'.tmp','w') as f:
+        json.dump(state,f)
+    os.replace(path+'.tmp',path)
+
+def generate(folder,num_positions,depth=6,workers=1,seed=0,scores=False,opening_plies=8,random_rate=0.1,
+             shard_size=dataset.SHARD_SIZE,progress=None):
+    """
+    Generates labelled positions until the dataset holds num_positions unique positions.
+    If the folder already holds a generation it carries on from where it stopped,
+    with the settings it was started with.
+
+    Parameters
+    ----------
+    folder : str
+        Folder of the dataset.
+    num_positions : int
+        Number of unique positions wanted in total.
+    depth : int, optional
+        Depth of the labelling search.
+    workers : int, optional
+        Number of worker processes.
+    seed : int, optional
+        Seed of the generation.
+    scores : bool, optional
+        Store the score of every column, not just the chosen one.
+    opening_plies : int, optional
+        Most random moves played at the start of a game.
+    random_rate : float, optional
+        Chance of playing a random move instead of the labelled one.
+    shard_size : int, optional
+        Positions per shard.
+    progress : function, optional
+        Called with the number of unique positions after each task.
+
+    Returns
+    -------
+    int
+        Number of unique positions in the dataset.
+    """
+    state = read_state(folder)
+    if state is None:
+        state = {'depth': depth,'seed': seed,'scores': scores,'opening_plies': opening_plies,
+                 'random_rate': random_rate,'next_task': 0}
+    writer = dataset.ShardWriter(folder,shard_size,state['scores'])
+    seen = set()
+    for boards,labels in dataset.BoardDataset(folder).arrays():
+        for board in np.asarray(boards):
+            seen.add(canonical_key(board))
+    count = len(seen)
+
+    task = state['next_task']
+    settings = (state['seed'],state['depth'],state['scores'],state['opening_plies'],state['random_rate'])
+    pool = ProcessPoolExecutor(max_workers=workers) if workers>1 else None
+    pending = collections.deque()
+    try:
+        while count<num_positions:
+            while pool is not None and len(pending)<2*workers:  #Keep the workers busy, results used in task order
+                pending.append((task,pool.submit(play_task,task,*settings)))
+                task += 1
+            if pool is None:
+                current,records = task,play_task(task,*settings)
+                task += 1
+            else:
+                current,future = pending.popleft()
+                records = future.result()
+            state['next_task'] = current + 1
+            shards = len(writer.manifest['shards'])
+            for key,board,label,column_scores in records:
+                if count>=num_positions:    #Stopped part way through, so run this task again on resuming
+                    state['next_task'] = current
+                    break
+                if key in seen:
+                    continue
+                seen.add(key)
+                writer.add(board,label,column_scores)
+                count += 1
+                if len(writer.manifest['shards'])!=shards:  #A shard was written: earlier tasks are saved
+                    shards = len(writer.manifest['shards'])
+                    write_state(folder,dict(state,next_task=current))
+            if progress is not None:
+                progress(count)
+        writer.close()
+        write_state(folder,state)
+    finally:
+        if pool is not None:
+            for task,future in pending:
+                future.cancel()
+            pool.shutdown()
+    return count
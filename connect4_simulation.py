@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+"""
+Headless gameplay: the SetGame class that manages a game, and a batch runner that
+plays many games across worker processes without needing the GUI.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+
+import numpy as np
+
+import connect4_algorithms as al
+import connect4_bitboard as bb
+import connect4_board as board
+import connect4_inference as inference
+
+MAX_GUI_GAMES = 1000    #Most games the GUI will simulate; headless runs have no limit
+CHUNK_SIZE = 25 #Games played by a worker per task
+NN_CHUNK_SIZE = 500 #Games per task when a neural network plays, which is also the largest batch
+RANDOM_CHUNK_SIZE = 20000   #Games per task when both players are Random, played as one array
+
+# A class that sets up the Connect 4 grid and manages the gameplay
+# play_move: Places the players disc at given position
+# move_checked: Checks the given position to make sure it is a legal move
+# make_move: Initiates player's algorithm to obtain position the player wants to play in
+#and ensures players alternate turns
+# determine_player: determines which players turn it is
+class SetGame:
+    def __init__(self,next_player,file_name,players):
+        self.board = board.Board()
+        self.grid = self.board.cells    #The board's int8 grid, read without a copy
+        self.next_player = next_player
+        self.x = 0
+        self.y = 0
+        self.file_name = file_name
+        self.players = players
+        for player in self.players:
+            player.new_game()
+       
+    def play_move(self,player_value):
+        """
+        Plays the player's disc at specified position, which must be the lowest
+        empty cell of its column.
+
+        Parameters
+        ----------
+        player_value : int
+            Player's associated value.
+
+        Returns
+        -------
+        None.
+        """
+        self.board.play(self.x,player_value)
+       
+    def move_checked(self):
+        """
+        Checks whether the move to make is legal.
+
+        Returns
+        -------
+        bool
+            Returns True if the move is legal or False if it is not.
+        """
+        if self.grid[self.y][self.x]!=0:
+            return False
+        elif self.y==5:
+            return True
+        elif self.grid[self.y+1][self.x]==0:
+            return False
+        else:
+            return True
+                
+    def make_move(self):
+        """
+        Obtains the position to place a disc and plays it.
+
+        Returns
+        -------
+        None.
+        """
+        move_made = False           
+        while not move_made:
+            self.y,self.x, = self.players[self.next_player].use_player_algorithm(self.board)
+            if SetGame.move_checked(self):
+                move_made = True
+        SetGame.play_move(self,self.players[self.next_player].player_number)
+        #if self.players[self.next_player].player_algorithm == 3:   #Used to create training files
+            #file_array = []
+            #for n in range(7):
+                #if n==self.x:
+               #     file_array.append(1)
+              #  else:
+             #       file_array.append(0)
+            
+            #with open(self.file_name,"ab") as f:
+            #    pickle.dump([self.grid,file_array],f)
+            #f.close()
+        self.players[self.next_player].player_moves += 1
+    
+    def determine_player(self): 
+        """
+        Determines which player is to play next.
+
+        Returns
+        -------
+        None.
+        """
+        SetGame.make_move(self)
+        player = self.next_player
+        if self.next_player > 0:
+            self.next_player -= 1
+        else:
+            self.next_player += 1
+        return self.x,self.y,player
+    
+    def play_column(self,x):
+        """
+        Plays a disc for the next player in a column chosen outside the game
+        (e.g. by batched inference), then passes the turn on.
+
+        Parameters
+        ----------
+        x : int
+            Column to play to. Must be playable.
+
+        Returns
+        -------
+        None.
+        """
+        player = self.next_player
+        self.x = x
+        self.y = self.players[player].get_row(x,self.grid)
+        SetGame.play_move(self,self.players[player].player_number)
+        self.players[player].player_moves += 1
+        if self.next_player > 0:
+            self.next_player -= 1
+        else:
+            self.next_player += 1
+        return self.x,self.y,player
+    
+    def last_move_won(self):
+        """
+        Checks whether the last disc played completed a line of 4, looking only at
+        the lines through it.
+
+        Returns
+        -------
+        bool
+            True if the last move won the game.
+        """
+        val = int(self.grid[self.y][self.x])
+        if val==0:  #No move played yet
+            return False
+        return bb.completes_line(self.board.boards[val-1],self.x*bb.COLUMN_BITS + bb.ROWS-1-self.y)
+
+
+def validate_num_games(num_games,algorithms,max_games=None):
+    """
+    Checks the number of games to simulate.
+
+    Parameters
+    ----------
+    num_games : str
+        Number of games entered by the user.
+    algorithms : list
+        Algorithms of both players.
+    max_games : int, optional
+        Most games allowed, or None for no limit.
+
+    Returns
+    -------
+    str or None
+        Message describing the problem, or None if the number of games is valid.
+    """
+    if not str.isdigit(num_games):
+        return 'Please check your inputs'
+    elif max_games is not None and int(num_games)>max_games:
+        return 'Max number of simulations is '+str(max_games)
+    elif int(num_games)==0:
+        return 'Must be at least 1 game'
+    elif int(num_games)!=1 and 'User Input' in algorithms:
+        return 'Must be 1 game for User Input'
+    return None
+
+def make_players(configs):
+    """
+    Creates the two players of a game from their settings.
+
+    Parameters
+    ----------
+    configs : list
+        One dict per player with an 'algorithm' and 'depth', plus any other
+        keyword arguments of Player (e.g. time_limit_ms, persist_table).
+
+    Returns
+    -------
+    players : list
+        Player 1 (yellow) and player 2 (red).
+    """
+    players = []
+    for n,colour in ((0,'yellow'),(1,'red')):
+        options = dict(configs[n])
+        algorithm = options.pop('algorithm')
+        depth = options.pop('depth')
+        players.append(al.Player(n+1,2-n,algorithm,depth,colour,**options))
+    return players
+
+def play_game(players,next_player):
+    """
+    Plays one game to the end.
+
+    Parameters
+    ----------
+    players : list
+        The two players.
+    next_player : int
+        Index of the player who moves first (0 or 1).
+
+    Returns
+    -------
+    winner : int or None
+        Index of the winning player, or None for a draw.
+    moves : list
+        Number of moves made by each player.
+    move_time : list
+        Seconds each player spent choosing their moves.
+    """
+    game = SetGame(next_player,'',players)
+    moves = [0, 0]
+    move_time = [0.0, 0.0]
+    while True:
+        start = time.perf_counter()
+        x,y,player = game.determine_player()
+        move_time[player] += time.perf_counter() - start
+        moves[player] += 1
+        if game.last_move_won():
+            return player,moves,move_time
+        elif game.board.is_full():
+            return None,moves,move_time
+
+def play_games_batched(players,first_game,num_games,results):
+    """
+    Plays several games side by side. Each round, every game whose next player is
+    an Artificial Neural Network is queued, and the queued positions are evaluated
+    in a single batch; other players move one game at a time as usual.
+
+    Parameters
+    ----------
+    players : list
+        The two players, shared by all the games.
+    first_game : int
+        Number of the first game, used to alternate who moves first.
+    num_games : int
+        Number of games to play.
+    results : dict
+        Running total the results are added to, see new_results.
+
+    Returns
+    -------
+    None.
+    """
+    games = [SetGame(n%2,'',players) for n in range(first_game,first_game+num_games)]
+    moves = [[0, 0] for game in games]
+    move_time = [[0.0, 0.0] for game in games]
+    active = list(range(len(games)))
+    queues = {}
+    while active:
+        finished = set()
+        waiting = []
+        for n in active:
+            game = games[n]
+            player = players[game.next_player]
+            if player.player_algorithm=='Artificial Neural Network':
+                if player.checkpoint not in queues:
+                    queues[player.checkpoint] = inference.InferenceQueue(player.checkpoint)
+                queue = queues[player.checkpoint]
+                waiting.append((n,queue,queue.submit(game.grid)))
+                continue
+            start = time.perf_counter()
+            x,y,player = game.determine_player()
+            move_time[n][player] += time.perf_counter() - start
+            moves[n][player] += 1
+            if game.last_move_won() or game.board.is_full():
+                finished.add(n)
+        
+        columns = {}
+        batch_time = {}
+        for checkpoint,queue in queues.items():
+            batch_size = len(queue.pending)
+            start = time.perf_counter()
+            columns[checkpoint] = queue.flush()
+            batch_time[checkpoint] = (time.perf_counter() - start) / max(1,batch_size)  #Shared by the batch
+        for n,queue,index in waiting:
+            game = games[n]
+            checkpoint = players[game.next_player].checkpoint
+            x,y,player = game.play_column(int(columns[checkpoint][index]))
+            move_time[n][player] += batch_time[checkpoint]
+            moves[n][player] += 1
+            if game.last_move_won() or game.board.is_full():
+                finished.add(n)
+        active = [n for n in active if n not in finished]
+    
+    for n,game in enumerate(games):
+        winner = game.next_player ^ 1 if game.last_move_won() else None    #The player who moved last
+        add_game(results,winner,moves[n],move_time[n])
+
+def add_game(results,winner,moves,move_time):
+    """
+    Adds the outcome of one game to a running total.
+
+    Parameters
+    ----------
+    results : dict
+        Running total, updated in place.
+    winner : int or None
+        Index of the winning player, or None for a draw.
+    moves : list
+        Number of moves made by each player.
+    move_time : list
+        Seconds each player spent choosing their moves.
+
+    Returns
+    -------
+    None.
+    """
+    results['games'] += 1
+    if winner is None:
+        results['draws'] += 1
+    else:
+        results['wins'][winner] += 1
+    for player in range(2):
+        results['moves'][player] += moves[player]
+        results['move_time'][player] += move_time[player]
+
+def new_results():
+    """
+    Creates an empty set of batch results.
+
+    Returns
+    -------
+    dict
+        Games played, wins of each player, draws, moves and move time of each player,
+        for pondering players the moves after a ponder, the moves whose reply
+        was predicted and the seconds saved, and for Solver players the moves that
+        fell back to alpha-beta.
+    """
+    return {'games': 0, 'wins': [0, 0], 'draws': 0, 'moves': [0, 0], 'move_time': [0.0, 0.0],
+            'ponders': [0, 0], 'ponder_hits': [0, 0], 'saved_time': [0.0, 0.0], 'fallbacks': [0, 0]}
+
+def merge_results(results,other):
+    """
+    Adds the results of some games to a running total, including the counts of game
+    lengths if they were kept.
+
+    Parameters
+    ----------
+    results : dict
+        Running total, updated in place.
+    other : dict
+        Results to add.
+
+    Returns
+    -------
+    None.
+    """
+    results['games'] += other['games']
+    results['draws'] += other['draws']
+    for n in range(2):
+        results['wins'][n] += other['wins'][n]
+        results['moves'][n] += other['moves'][n]
+        results['move_time'][n] += other['move_time'][n]
+        results['ponders'][n] += other['ponders'][n]
+        results['ponder_hits'][n] += other['ponder_hits'][n]
+        results['saved_time'][n] += other['saved_time'][n]
+        results['fallbacks'][n] += other['fallbacks'][n]
+    if 'lengths' in other:
+        lengths = results.setdefault('lengths',[0]*len(other['lengths']))
+        for n,count in enumerate(other['lengths']):
+            lengths[n] += count
+
+def play_random_games(first_game,num_games,seed=None):
+    """
+    Plays games between two Random players all at once, as arrays of bitboards
+    (one row per game). Each round every unfinished game plays a legal column chosen
+    uniformly at random, and wins are found with vectorised line checks.
+
+    Parameters
+    ----------
+    first_game : int
+        Number of the first game, used to alternate who moves first.
+    num_games : int
+        Number of games to play.
+    seed : int, optional
+        Seed of the random moves.
+
+    Returns
+    -------
+    results : dict
+        Results of the games, see new_results. The time taken is shared between
+        the moves, and 'lengths' counts the games ending after each number of moves.
+    """
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    first = np.arange(first_game,first_game+num_games) % 2
+    empty = np.zeros(num_games,dtype=np.uint64)
+    winner,length = bb.random_games(empty,empty,rng)
+    winner = np.where(winner==-1,-1,(first + winner) % 2)   #From whoever moved first to player 1 or 2
+    
+    first_moves = (length + 1) // 2     #Moves of whoever started each game
+    results = new_results()
+    results['games'] = num_games
+    results['draws'] = int((winner==-1).sum())
+    results['wins'] = [int((winner==0).sum()), int((winner==1).sum())]
+    results['moves'] = [int(np.where(first==0,first_moves,length-first_moves).sum()),
+                        int(np.where(first==1,first_moves,length-first_moves).sum())]
+    seconds = time.perf_counter() - start
+    total_moves = max(1,int(length.sum()))
+    results['move_time'] = [seconds*results['moves'][0]/total_moves, seconds*results['moves'][1]/total_moves]
+    results['lengths'] = np.bincount(length,minlength=43).tolist()
+    return results
+
+_worker_players = {}
+
+def play_games(configs,first_game,num_games):
+    """
+    Plays a run of consecutive games, alternating who moves first by game number.
+    Games with a neural network player are played side by side so its moves
+    can be evaluated in batches, and games between Random players as arrays.
+
+    Parameters
+    ----------
+    configs : list
+        Settings of the two players, see make_players.
+    first_game : int
+        Number of the first game of the run.
+    num_games : int
+        Number of games to play.
+
+    Returns
+    -------
+    results : dict
+        Results of the games, see new_results.
+    """
+    if configs[0]['algorithm']=='Random' and configs[1]['algorithm']=='Random':
+        return play_random_games(first_game,num_games)
+    key = repr(configs)
+    players = _worker_players.get(key)
+    if players is None:     #Players are kept so persisted tables carry over between runs
+        players = make_players(configs)
+        _worker_players[key] = players
+    results = new_results()
+    counts = [(player.ponders,player.ponder_hits,player.saved_seconds,player.fallbacks) for player in players]
+    if any(player.player_algorithm=='Artificial Neural Network' for player in players):
+        play_games_batched(players,first_game,num_games,results)
+    else:
+        for n in range(first_game,first_game+num_games):
+            winner,moves,move_time = play_game(players,n%2)
+            add_game(results,winner,moves,move_time)
+    for n,player in enumerate(players):     #The players may be kept from earlier runs, so only this run's share
+        player.stop_pondering()
+        results['ponders'][n] += player.ponders - counts[n][0]
+        results['ponder_hits'][n] += player.ponder_hits - counts[n][1]
+        results['saved_time'][n] += player.saved_seconds - counts[n][2]
+        results['fallbacks'][n] += player.fallbacks - counts[n][3]
+    return results
+
+def run_batch(configs,num_games,workers=1,progress=None,chunk_size=None,mp_context=None):
+    """
+    Plays a batch of games, spreading them across worker processes. Player 1 moves
+    first in even-numbered games and player 2 in odd-numbered games.
+
+    Parameters
+    ----------
+    configs : list
+        Settings of the two players, see make_players.
+    num_games : int
+        Number of games to play.
+    workers : int, optional
+        Number of worker processes. With 1, games are played in this process.
+    progress : function, optional
+        Called with the results so far each time a run of games finishes.
+    chunk_size : int, optional
+        Number of games a worker plays per task. By default CHUNK_SIZE, NN_CHUNK_SIZE
+        when a neural network plays or RANDOM_CHUNK_SIZE when both players are Random.
+    mp_context : str, optional
+        Multiprocessing start method for the workers, e.g. 'spawn'.
+
+    Returns
+    -------
+    results : dict
+        Results of the batch, see new_results, with the wall-clock 'seconds' taken.
+    """
+    start = time.perf_counter()
+    results = new_results()
+    if chunk_size is None:
+        if 'Artificial Neural Network' in (configs[0]['algorithm'],configs[1]['algorithm']):
+            chunk_size = NN_CHUNK_SIZE
+        elif configs[0]['algorithm']=='Random' and configs[1]['algorithm']=='Random':
+            chunk_size = RANDOM_CHUNK_SIZE
+        else:
+            chunk_size = CHUNK_SIZE
+    chunks = [(n,min(chunk_size,num_games-n)) for n in range(0,num_games,chunk_size)]
+    if workers<=1:
+        for first_game,count in chunks:
+            merge_results(results,play_games(configs,first_game,count))
+            if progress is not None:
+                progress(results)
+    else:
+        context = multiprocessing.get_context(mp_context) if mp_context else None
+        with ProcessPoolExecutor(max_workers=workers,mp_context=context) as pool:
+            futures = [pool.submit(play_games,configs,first_game,count) for first_game,count in chunks]
+            for future in as_completed(futures):
+                merge_results(results,future.result())
+                if progress is not None:
+                    progress(results)
+    results['seconds'] = time.perf_counter() - start
+    return results
@@ -0,0 +1,406 @@
+# -*- coding: utf-8 -*-
+"""
+Perfect-play solver. Finds the game-theoretic value of a position by negamax
+with null-window searches, on bitboards and with a transposition table.
+
+Scores follow the usual Connect 4 solver convention, from the point of view of
+the player to move: 0 is a draw, a positive score is a win and a negative score
+a loss, and the sooner the game is won the larger the score (see outcome).
+"""
+import random
+import time
+
+import numpy as np
+
+import connect4_bitboard as bb
+import connect4_transposition as tt
+
+CELLS = bb.ROWS * bb.COLUMNS
+COLUMN_MASKS = tuple(((1 << bb.ROWS) - 1) << x*bb.COLUMN_BITS for x in range(bb.COLUMNS))
+DEFAULT_EMPTY_CELLS = 10
+
+class SolveTimeout(Exception):
+    """
+    Raised inside the solver when its deadline has passed.
+    """
+    pass
+
+def outcome(score,moves):
+    """
+    Describes a solved score.
+
+    Parameters
+    ----------
+    score : int
+        Score of the position.
+    moves : int
+        Number of discs in the position.
+
+    Returns
+    -------
+    result : str
+        'win', 'loss' or 'draw' for the player to move.
+    plies : int
+        Moves left until the game ends with best play from both sides.
+    """
+    if score==0:
+        return 'draw',CELLS-moves
+    discs = CELLS + 1 - 2*abs(score)    #Discs on the board after the winning move, or one more
+    if (discs - moves) % 2 != (1 if score>0 else 0):
+        discs += 1
+    return ('win' if score>0 else 'loss'),discs-moves
+
+class EndgameTable:
+    def __init__(self,keys,scores,empty_cells):
+        self.keys = keys
+        self.scores = scores
+        self.empty_cells = empty_cells
+        self.positions = dict(zip(keys.tolist(),scores.tolist()))
+
+    @classmethod
+    def load(cls,path):
+        """
+        Loads a table saved with save.
+
+        Parameters
+        ----------
+        path : str
+            File of the table.
+
+        Returns
+        -------
+        EndgameTable
+            The loaded table.
+        """
+        with np.load(path) as data:
+            return cls(data['keys'],data['scores'],int(data['empty_cells']))
+
+    def save(self,path):
+        """
+        Saves the table as sorted keys and their scores.
+
+        Parameters
+        ----------
+        path : str
+            File to save to.
+
+        Returns
+        -------
+        None.
+        """
+        order = np.argsort(self.keys)
+        np.savez(path,keys=self.keys[order],scores=self.scores[order],empty_cells=self.empty_cells)
+
+    def get(self,key):
+        return self.positions.get(key)
+
+class Solver:
+    def __init__(self,table_size_mb=tt.DEFAULT_SIZE_MB,endgame_table=None):
+        self.table = tt.TranspositionTable(table_size_mb)
+        if isinstance(endgame_table,str):
+            endgame_table = EndgameTable.load(endgame_table)
+        self.endgame_table = endgame_table
+        self.nodes = 0
+        self.endgame_hits = 0
+        self.deadline = None
+
+    def get_stats(self):
+        """
+        Gets the counters of the solver.
+
+        Returns
+        -------
+        dict
+            Positions searched, endgame table hits and the transposition table statistics.
+        """
+        return {'nodes': self.nodes,'endgame_hits': self.endgame_hits,'table': self.table.get_stats()}
+
+    def solve(self,board,val,deadline=None):
+        """
+        Finds the exact score of a position.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        val : int
+            Value of the player to move.
+        deadline : float, optional
+            time.perf_counter() value after which SolveTimeout is raised.
+
+        Returns
+        -------
+        int
+            Score of the position for the player to move.
+        """
+        self.deadline = deadline
+        current = board.boards[val-1]
+        mask = board.boards[0] | board.boards[1]
+        moves = board.counter
+        possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+        if possible & bb.open_cells(current,mask):
+            return (CELLS + 1 - moves) // 2
+        return self._solve(current,mask,moves)
+
+    def best_move(self,board,val,deadline=None):
+        """
+        Finds a move with the best exact score, preferring central columns among equals.
+
+        Parameters
+        ----------
+        board : Bitboard
+            Current state of the game.
+        val : int
+            Value of the player to move.
+        deadline : float, optional
+            time.perf_counter() value after which SolveTimeout is raised.
+
+        Returns
+        -------
+        best_move : int
+            Column to play.
+        best_score : int
+            Score of the position for the player to move.
+        """
+        self.deadline = deadline
+        self.table.new_search()
+        current = board.boards[val-1]
+        mask = board.boards[0] | board.boards[1]
+        moves = board.counter
+        possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+        wins = possible & bb.open_cells(current,mask)
+        best_move = None
+        best_score = None
+        for x in bb.COLUMN_ORDER:
+            move = possible & COLUMN_MASKS[x]
+            if not move:
+                continue
+            if move & wins:
+                return x,(CELLS + 1 - moves) // 2
+            opponent = current ^ mask
+            if ((mask|move) + bb.BOTTOM_MASK) & bb.FULL_MASK & bb.open_cells(opponent,mask|move):
+                score = -((CELLS - moves) // 2)     #The opponent wins with their next move
+            elif best_score is None:
+                score = -self._solve(opponent,mask|move,moves+1)
+            elif -self.__negamax(opponent,mask|move,moves+1,-best_score-1,-best_score)>best_score:
+                score = -self._solve(opponent,mask|move,moves+1)   #Better than the best so far: find by how much
+            else:
+                continue
+            if best_score is None or score>best_score:
+                best_move,best_score = x,score
+        return best_move,best_score
+
+    def _solve(self,current,mask,moves):
+        """
+        Narrows the score of a position down with null-window searches.
+
+        Parameters
+        ----------
+        current : int
+            Bitmask of the discs of the player to move.
+        mask : int
+            Bitmask of every disc.
+        moves : int
+            Number of discs.
+
+        Returns
+        -------
+        int
+            Score of the position, which must not be won with the next move.
+        """
+        low = -((CELLS - moves) // 2)
+        high = (CELLS + 1 - moves) // 2
+        while low<high:
+            middle = low + (high - low) // 2
+            if middle<=0 and int(low/2)<middle:     #Test for a draw or a quick result first
+                middle = int(low/2)
+            elif middle>=0 and int(high/2)>middle:
+                middle = int(high/2)
+            score = self.__negamax(current,mask,moves,middle,middle+1)
+            if score<=middle:
+                high = score
+            else:
+                low = score
+        return low
+
+    def __negamax(self,current,mask,moves,alpha,beta):
+        """
+        Searches a position to the end of the game within a window.
+
+        Parameters
+        ----------
+        current : int
+            Bitmask of the discs of the player to move.
+        mask : int
+            Bitmask of every disc.
+        moves : int
+            Number of discs.
+        alpha : int
+            Score the player to move is already assured of.
+        beta : int
+            Score the opponent is already assured of.
+
+        Returns
+        -------
+        int
+            The score if it is inside the window, otherwise the bound it passed.
+            The player to move must not be able to win with their next move.
+        """
+        self.nodes += 1
+        if self.deadline is not None and not self.nodes & 4095 and time.perf_counter()>self.deadline:
+            raise SolveTimeout
+        opponent = current ^ mask
+        threats = bb.open_cells(opponent,mask)
+        possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+        forced = possible & threats
+        if forced:
+            if forced & (forced - 1):   #Two threats cannot both be blocked
+                return -((CELLS - moves) // 2)
+            possible = forced
+        possible &= ~(threats >> 1)     #Never play under a cell the opponent would win on
+        if not possible:
+            return -((CELLS - moves) // 2)
+        if moves>=CELLS-2:
+            return 0
+
+        low = -((CELLS - 2 - moves) // 2)
+        if alpha<low:
+            alpha = low
+            if alpha>=beta:
+                return alpha
+        if beta>(CELLS - 1 - moves) // 2:
+            beta = (CELLS - 1 - moves) // 2
+            if alpha>=beta:
+                return beta
+
+        key = current + mask    #Unique for every position
+        empty = CELLS - moves
+        if self.endgame_table is not None and empty==self.endgame_table.empty_cells:
+            score = self.endgame_table.get(key)
+            if score is not None:
+                self.endgame_hits += 1
+                return score
+        entry = self.table.probe(key,empty)
+        tt_move = None
+        if entry is not None:
+            flag,score,tt_move = entry
+            if flag==tt.EXACT:
+                return score
+            if flag==tt.LOWER and score>alpha:
+                alpha = score
+            elif flag==tt.UPPER and score<beta:
+                beta = score
+            if alpha>=beta:
+                return alpha
+
+        candidates = []
+        for x in bb.COLUMN_ORDER:
+            move = possible & COLUMN_MASKS[x]
+            if move:
+                threats_made = bb.open_cells(current|move,mask|move)    #Prefer moves making the most threats
+                candidates.append((x==tt_move,bin(threats_made).count('1'),x,move))
+        candidates.sort(key=lambda candidate: (candidate[0],candidate[1]),reverse=True)
+
+        best_move = None
+        for is_tt_move,threat_count,x,move in candidates:
+            score = -self.__negamax(opponent,mask|move,moves+1,-beta,-alpha)
+            if score>=beta:
+                self.table.store(key,empty,tt.LOWER,score,x)
+                return score
+            if score>alpha:
+                alpha = score
+                best_move = x
+        if best_move is None:
+            self.table.store(key,empty,tt.UPPER,alpha,candidates[0][2])
+        else:
+            self.table.store(key,empty,tt.EXACT,alpha,best_move)
+        return alpha
+
+def quiet_positions(count,discs,seed=4801):
+    """
+    Generates positions by playing random moves that neither side loses to at
+    once, so the game is still open when the position is reached.
+
+    Parameters
+    ----------
+    count : int
+        Number of positions to generate.
+    discs : int
+        Discs in each position.
+    seed : int, optional
+        Seed of the generator.
+
+    Returns
+    -------
+    positions : list
+        (grid, value of the player to move) pairs.
+    """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions)<count:
+        board = bb.Bitboard()
+        val = 1
+        while board.counter<discs:
+            current = board.boards[val-1]
+            mask = board.boards[0] | board.boards[1]
+            possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+            threats = bb.open_cells(current ^ mask,mask)
+            safe = possible & ~(threats >> 1) & ~bb.open_cells(current,mask)
+            if possible & threats:
+                safe &= threats
+            columns = [x for x in range(bb.COLUMNS) if safe & COLUMN_MASKS[x]]
+            if not columns:
+                break
+            board.play(rng.choice(columns),val)
+            val = 3 - val
+        else:
+            positions.append((board.to_grid(),val))
+    return positions
+
+def build_endgame_table(positions,empty_cells=DEFAULT_EMPTY_CELLS,table_size_mb=tt.DEFAULT_SIZE_MB,progress=None):
+    """
+    Solves every position with a given number of empty cells that can follow the
+    given positions, for an EndgameTable.
+
+    Parameters
+    ----------
+    positions : list
+        (grid, value of the player to move) pairs with more empty cells than empty_cells.
+    empty_cells : int, optional
+        Empty cells of the positions stored.
+    table_size_mb : int, optional
+        Transposition table size of the solver.
+    progress : function, optional
+        Called with the number of positions solved.
+
+    Returns
+    -------
+    EndgameTable
+        Scores of the positions, for the player to move.
+    """
+    solver = Solver(table_size_mb)
+    scores = {}
+    for grid,val in positions:
+        board = bb.Bitboard.from_grid(grid)
+        frontier = [(board.boards[val-1],board.boards[0] | board.boards[1])]
+        for moves in range(board.counter,CELLS-empty_cells):
+            following = set()
+            for current,mask in frontier:
+                possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+                if possible & bb.open_cells(current,mask):  #Won by the next move, so the game never gets further
+                    continue
+                for move in COLUMN_MASKS:
+                    move &= possible
+                    if move:
+                        following.add((current ^ mask,mask|move))
+            frontier = following
+        for current,mask in frontier:
+            key = current + mask
+            possible = (mask + bb.BOTTOM_MASK) & bb.FULL_MASK
+            if key in scores or possible & bb.open_cells(current,mask):     #The solver never looks these up
+                continue
+            scores[key] = solver._solve(current,mask,CELLS-empty_cells)
+            if progress is not None:
+                progress(len(scores))
+    keys = np.array(list(scores),dtype=np.uint64)
+    return EndgameTable(keys,np.array(list(scores.values()),dtype=np.int8),empty_cells)
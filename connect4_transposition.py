@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Transposition table used by the Minimax search to avoid re-searching positions
+reached through different move orders.
+"""
+import sys
+
+EXACT = 0
+LOWER = 1   #Stored score is a lower bound (the search failed high)
+UPPER = 2   #Stored score is an upper bound (the search failed low)
+
+def _entry_bytes():
+    """
+    Measures the memory one stored entry takes: its slot in the table, the tuple,
+    and the key and score, which are objects of their own (the depth, flag, move
+    and generation are small ints shared by every entry). Each object is rounded
+    up to the 16 bytes Python allocates in.
+
+    Returns
+    -------
+    int
+        Bytes per entry.
+    """
+    key = (1 << 64) - 1     #Hashes are 64-bit
+    score = -(1 << 20)     #Scores are outside the small ints Python caches
+    entry = (key, 0, 0, score, 0, 0)
+    size = 0
+    for item in (entry, key, score):
+        size += -(-sys.getsizeof(item) // 16) * 16
+    return size + sys.getsizeof([None]) - sys.getsizeof([])
+
+ENTRY_BYTES = _entry_bytes()
+DEFAULT_SIZE_MB = 16
+
+class TranspositionTable:
+    def __init__(self,size_mb=DEFAULT_SIZE_MB):
+        self.capacity = max(1, int(size_mb * 2**20) // ENTRY_BYTES)
+        self.slots = [None] * self.capacity
+        self.generation = 0
+        self.occupied = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def new_search(self):
+        """
+        Marks the start of a new search so that older entries are replaced first.
+
+        Returns
+        -------
+        None.
+        """
+        self.generation += 1
+
+    def clear(self):
+        """
+        Empties the table and resets its counters.
+
+        Returns
+        -------
+        None.
+        """
+        self.slots = [None] * self.capacity
+        self.generation = 0
+        self.occupied = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.overwrites = 0
+        self.rejected = 0
+
+    def probe(self,key,depth):
+        """
+        Looks up a position. Entries are only returned for the same remaining depth,
+        so the search gives the same results as it would without the table.
+
+        Parameters
+        ----------
+        key : int
+            Hash of the position.
+        depth : int
+            Remaining depth the position is being searched to.
+
+        Returns
+        -------
+        tuple or None
+            (bound type, score, best move) if the position is stored, None otherwise.
+        """
+        self.probes += 1
+        entry = self.slots[key % self.capacity]
+        if entry is not None and entry[0]==key and entry[1]==depth:
+            self.hits += 1
+            return entry[2], entry[3], entry[4]
+        return None
+
+    def get_move(self,key):
+        """
+        Gets the best move stored for a position, whatever depth it was searched to.
+
+        Parameters
+        ----------
+        key : int
+            Hash of the position.
+
+        Returns
+        -------
+        int or None
+            The stored best column, or None if the position is not stored.
+        """
+        entry = self.slots[key % self.capacity]
+        if entry is not None and entry[0]==key:
+            return entry[4]
+        return None
+
+    def store(self,key,depth,flag,score,move):
+        """
+        Stores the result of searching a position. When the slot is taken by another
+        position, it is only replaced if that entry is from an older search or was
+        searched to a depth no greater than this one.
+
+        Parameters
+        ----------
+        key : int
+            Hash of the position.
+        depth : int
+            Remaining depth the position was searched to.
+        flag : int
+            EXACT, LOWER or UPPER.
+        score : int
+            Score found by the search.
+        move : int
+            Best column found by the search.
+
+        Returns
+        -------
+        None.
+        """
+        index = key % self.capacity
+        entry = self.slots[index]
+        if entry is None:
+            self.occupied += 1
+        elif entry[0]!=key and entry[5]==self.generation and entry[1]>depth:
+            self.rejected += 1
+            return
+        elif entry[0]!=key:
+            self.overwrites += 1
+        self.slots[index] = (key, depth, flag, score, move, self.generation)
+        self.stores += 1
+
+    def get_stats(self):
+        """
+        Gets the counters used to size the table.
+
+        Returns
+        -------
+        dict
+            Probes, hits, hit rate, stores, overwrites, rejected stores, occupied slots,
+            capacity and occupancy (fraction of slots in use).
+        """
+        return {
+            'probes': self.probes,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.probes if self.probes else 0.0,
+            'stores': self.stores,
+            'overwrites': self.overwrites,
+            'rejected': self.rejected,
+            'occupied': self.occupied,
+            'capacity': self.capacity,
+            'occupancy': self.occupied / self.capacity,
+        }
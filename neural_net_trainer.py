@@ -4,11 +4,28 @@ Created on Sat Apr  2 22:55:17 2022
 
 @author: tbere
 """
-import pickle
 import torch
 from torch import nn
 import torch.nn.functional as F
+from torch.utils.data import DataLoader
+import numpy as np
 import os
+import threading
+import time
+
+import connect4_dataset as dataset
+
+CHECKPOINTS = [     #Models trained with train_and_test that players can use
+    'cnnmodel.pt',
+    'cnnmodel_lr_large.pt',
+    'cnnmodel_lr_small.pt',
+    'cnnmodel_demo.pt'
+]
+DEFAULT_CHECKPOINT = 'cnnmodel.pt'
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_models = {}    #Loaded models shared by every player in the process, by checkpoint
+_models_lock = threading.Lock()
     
 class ConvNet(nn.Module):
     def __init__(self):
@@ -37,88 +54,154 @@ class ConvNet(nn.Module):
         output = self.fc(output) 
         return output 
 
-def train_and_test():
+def load_model(checkpoint=DEFAULT_CHECKPOINT):
     """
-    Function used to train and test a CNN using the ConvNet model.
+    Gets the model for a checkpoint, loading it from disk the first time it is asked
+    for and sharing it afterwards. The model is put in evaluation mode and should
+    only be used for inference.
+
+    Parameters
+    ----------
+    checkpoint : str, optional
+        File of the checkpoint, relative to this folder or absolute.
+
     Returns
     -------
-    None.
+    cnn : ConvNet
+        The loaded model.
+    """
+    cnn = _models.get(checkpoint)
+    if cnn is None:
+        with _models_lock:
+            cnn = _models.get(checkpoint)
+            if cnn is None:
+                cnn = ConvNet()
+                cnn.load_state_dict(torch.load(os.path.join(MODEL_DIR,checkpoint),map_location='cpu'))
+                cnn.eval()
+                for parameter in cnn.parameters():
+                    parameter.requires_grad_(False)
+                _models[checkpoint] = cnn
+    return cnn
 
+def train_and_test(train_data='./data/train',test_data='./data/test',checkpoint='cnnmodel_demo.pt',
+                   num_epochs=2,batch_size=64,learning_rate=0.01,optimiser_name='sgd',momentum=0.0,
+                   lr_decay=1.0,workers=0,seed=None):
+    """
+    Function used to train and test a CNN using the ConvNet model, with mini-batches
+    read from datasets made by connect4_dataset (see 'python -m connect4_cli convert-data').
+
+    Parameters
+    ----------
+    train_data : str, optional
+        Folder of the training dataset.
+    test_data : str, optional
+        Folder of the test dataset, or None to skip testing.
+    checkpoint : str, optional
+        File the trained state dict is saved to, relative to this folder or absolute.
+    num_epochs : int, optional
+        Number of passes over the training data.
+    batch_size : int, optional
+        Positions per optimiser step.
+    learning_rate : float, optional
+        Learning rate of the optimiser. Massively affects performance.
+    optimiser_name : str, optional
+        'sgd' or 'adam'.
+    momentum : float, optional
+        Momentum of SGD.
+    lr_decay : float, optional
+        Factor the learning rate is multiplied by after each epoch.
+    workers : int, optional
+        DataLoader worker processes.
+    seed : int, optional
+        Seed for the weights and the shuffling, for repeatable training.
+
+    Returns
+    -------
+    acc : float or None
+        Percentage of test positions where the CNN picks the labelled column.
     """
     device = 'cpu'
-    num_epochs  = 2 #Number of times to train - does not affect accuracy
-    learning_rate = 0.01 #Massively affects performance 
+    if seed is not None:
+        torch.manual_seed(seed)
     
     cnn = ConvNet().to(device)
     
     #loss/optimiser
     criterion = nn.CrossEntropyLoss()
-    optimiser = torch.optim.SGD(cnn.parameters(),lr = learning_rate)
+    if optimiser_name=='adam':
+        optimiser = torch.optim.Adam(cnn.parameters(),lr = learning_rate)
+    else:
+        optimiser = torch.optim.SGD(cnn.parameters(),lr = learning_rate,momentum = momentum)
+    scheduler = torch.optim.lr_scheduler.ExponentialLR(optimiser,gamma = lr_decay)
     
-    train_dir = os.listdir('./train')
-    for n in range(1,len(train_dir)):
-        images = [] #board input
-        labels = []
-        file_extension = './train/Game'+str(n)+"_Depth_6.pkl"
-        with open(file_extension,'rb') as f:
-            while True:
-                try:
-                    training_data=pickle.load(f)
-                    images.append(torch.tensor(training_data[0]).float().flatten())
-                    labels.append(torch.tensor(training_data[1]).float())
-                except EOFError:
-                    break
-        f.close()
-        
-        # train loop
-        for epoch in range(num_epochs):
-            for i in range(len(images)):
-                images[i] = images[i].view((1,1,6,7))
-                image =  images[i].to(device)
-                label = labels[i].to(device)
-                
-                #forward
-                outputs = cnn(image)
-                label = label.view(-1,label.size(0))
-                loss = criterion(outputs,label)
-                
-                #backward
-                optimiser.zero_grad()   
-                loss.backward()
-                optimiser.step()
-    torch.save(cnn.state_dict(),'cnnmodel_demo.pt')
+    train_set = dataset.BoardDataset(train_data)
+    loader = DataLoader(train_set,batch_size=batch_size,shuffle=True,num_workers=workers,
+                        persistent_workers=workers>0)
     
-    test_dir = os.listdir('./test')
+    # train loop
+    cnn.train()
+    for epoch in range(num_epochs):
+        start = time.perf_counter()
+        total_loss = 0.0
+        for images,labels in loader:
+            images = images.to(device)
+            labels = labels.to(device)
+            
+            #forward
+            outputs = cnn(images)
+            loss = criterion(outputs,labels)
+            
+            #backward
+            optimiser.zero_grad()   
+            loss.backward()
+            optimiser.step()
+            total_loss += loss.item() * len(labels)
+        scheduler.step()
+        seconds = time.perf_counter() - start
+        print('Epoch '+str(epoch+1)+'/'+str(num_epochs)+': loss '+str(round(total_loss/len(train_set),4))+
+              ', '+str(round(len(train_set)/seconds))+' samples/sec')
+    torch.save(cnn.state_dict(),os.path.join(MODEL_DIR,checkpoint))
+    
+    if test_data is None:
+        return None
+    acc = test(cnn,test_data,batch_size=max(batch_size,1024))
+    print(str(acc)+"%")
+    return acc
+
+def test(cnn,test_data,batch_size=1024):
+    """
+    Measures how often the CNN picks the labelled column of a dataset. Raises
+    ValueError if the dataset is missing or empty.
+
+    Parameters
+    ----------
+    cnn : ConvNet
+        Model to test.
+    test_data : str
+        Folder of the test dataset.
+    batch_size : int, optional
+        Positions evaluated per forward pass.
+
+    Returns
+    -------
+    acc : float
+        Percentage of positions where the highest scoring column is the labelled one.
+    """
+    test_set = dataset.BoardDataset(test_data)
+    if len(test_set)==0:
+        raise ValueError(str(test_data)+' holds no positions to test on')
+    cnn.eval()
     correct = 0
     number_of_samples = 0
-    for n in range(len(train_dir)+1,len(train_dir)+len(test_dir)):
-        images = [] #board input
-        labels = []
-        with torch.no_grad():
-            file_extension = './test/Game'+str(n)+"_Depth_6.pkl"
-            with open(file_extension,'rb') as f:
-                while True:
-                    try:
-                        training_data=pickle.load(f)
-                        images.append(torch.tensor(training_data[0]).float().flatten())
-                        labels.append(training_data[1])
-                    except EOFError:
-                        break
-            f.close()
-            for i in range(len(images)):
-                images[i] = images[i].view((1,1,6,7))
-                image = images[i].to(device)
-                label = labels[i]
-                
-                outputs = cnn(image)
+    with torch.no_grad():
+        for boards,labels in test_set.arrays():
+            for n in range(0,len(labels),batch_size):
+                images = torch.from_numpy(np.array(boards[n:n+batch_size],dtype=np.float32)).view(-1,1,6,7)
+                outputs = cnn(images)
                 #value, index
-                _,column = torch.max(outputs,1) 
-    
-                label_index = label.index(1)
-                correct += (column.item() == label_index)
-                number_of_samples += 1
-    
-    acc = 100 * (correct / number_of_samples)
-    print(str(acc)+"%")
+                _,columns = torch.max(outputs,1)
+                correct += int((columns.numpy()==labels[n:n+batch_size]).sum())
+                number_of_samples += len(columns)
+    return 100 * (correct / number_of_samples)
 
 #train_and_test()
\ No newline at end of file
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the Board: undoing moves, packed keys and hashing, and when its grid is
+copied. Run with: python -m pytest test_connect4_board.py
+"""
+import random
+
+import numpy as np
+import pytest
+
+import connect4_bitboard as bb
+import connect4_board as game_board
+import connect4_book as opening
+
+def random_game(seed,plies=42):
+    """
+    Plays random moves on a new board, stopping at a win.
+
+    Parameters
+    ----------
+    seed : int
+        Seed of the moves.
+    plies : int, optional
+        Most moves to play.
+
+    Returns
+    -------
+    board : Board
+        The board after the moves.
+    val : int
+        Value of the player to move.
+    """
+    rng = random.Random(seed)
+    board = game_board.Board()
+    val = 1
+    for n in range(plies):
+        columns = [x for x in range(bb.COLUMNS) if board.can_play(x)]
+        if not columns:
+            break
+        board.play(rng.choice(columns),val)
+        if board.has_won(val):
+            break
+        val = 3 - val
+    return board,val
+
+def state(board):
+    return board.cells.copy(),list(board.boards),list(board.heights),list(board.moves)
+
+@pytest.mark.parametrize('seed',range(20))
+def test_undo_restores_every_position(seed):
+    rng = random.Random(seed)
+    board = game_board.Board()
+    states = [state(board)]
+    val = 1
+    while not board.is_full():
+        board.play(rng.choice([x for x in range(bb.COLUMNS) if board.can_play(x)]),val)
+        states.append(state(board))
+        val = 3 - val
+    for expected in reversed(states[:-1]):
+        board.undo()
+        cells,boards,heights,moves = state(board)
+        assert np.array_equal(cells,expected[0])
+        assert (boards,heights,moves)==expected[1:]
+    assert board.key()==game_board.Board().key()
+
+@pytest.mark.parametrize('seed',range(20))
+def test_key_round_trip(seed):
+    board,val = random_game(seed,random.Random(seed).randint(0,42))
+    for player in (1,2):
+        unpacked = game_board.Board.from_key(board.key(player),player)
+        assert unpacked==board
+        assert hash(unpacked)==hash(board)
+        assert np.array_equal(unpacked.cells,board.cells)
+        assert unpacked.heights==board.heights
+        assert unpacked.moves==[]
+
+def test_keys_tell_positions_apart():
+    boards = [random_game(seed,random.Random(seed).randint(0,20))[0] for seed in range(200)]
+    for board in boards:
+        for other in boards:
+            assert (board.key()==other.key())==(board==other)
+    assert len(set(boards))==len({board.key() for board in boards})
+
+def test_hash_follows_moves():
+    board = game_board.Board()
+    board.play(3,1)
+    board.play(3,2)
+    transposed = game_board.Board()
+    transposed.play(3,1)
+    transposed.play(3,2)
+    assert board==transposed and hash(board)==hash(transposed)
+    board.play(2,1)
+    assert board!=transposed
+    board.undo()
+    assert board==transposed and hash(board)==hash(transposed)
+
+@pytest.mark.parametrize('seed',range(10))
+def test_key_is_the_book_key(seed):
+    board,val = random_game(seed,8)
+    key,is_mirrored = opening.position_key(board.to_bitboard(),val)
+    if not is_mirrored:
+        assert key==board.key(val)
+    assert bb.unpack_key(board.key(val))==(board.boards[val-1],board.boards[0] | board.boards[1])
+
+def test_array_copies_unless_asked_not_to():
+    board = game_board.Board()
+    board.play(3,1)
+    for grid in (np.array(board),np.asarray(board),np.array(board,dtype=np.float32)):
+        assert not np.shares_memory(grid,board.cells)
+        assert grid[bb.ROWS-1,3]==1
+        grid[0,0] = 2
+        assert board.cells[0,0]==0
+    view = np.asarray(board,copy=False)
+    assert np.shares_memory(view,board.cells)
+    board.play(4,2)
+    assert view[bb.ROWS-1,4]==2
+    with pytest.raises(ValueError):
+        np.asarray(board,dtype=np.float32,copy=False)
+
+def test_copy_is_independent():
+    board,val = random_game(3,10)
+    copied = board.copy()
+    assert copied==board and copied.moves==board.moves
+    copied.play(next(x for x in range(bb.COLUMNS) if copied.can_play(x)),val)
+    copied.undo()
+    copied.undo()
+    assert copied!=board
+    assert len(board.moves)==len(copied.moves) + 1
+    assert not np.shares_memory(copied.cells,board.cells)